@@ -1,29 +1,40 @@
 import os
 import json
+import asyncio
 import re
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage
 
 # It's good practice to keep imports at the top
-from generating_syllabus import generate_syllabus as gen_syllabus
-from teaching_agent import teaching_agent
+from generating_syllabus import generate_syllabus as gen_syllabus, agenerate_syllabus as agen_syllabus
+from instructor_sessions import instructor_sessions
+from llm_cache import llm_cache, normalize_topic
+from llm_limits import llm_slot, LLMOverloaded
+from llm_clients import get_llm
+from single_flight import single_flight
 
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
-def generate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5) -> dict:
-    """
-    Generates multiple-choice questions for a given topic using an LLM.
-    This function is now more robust against formatting errors from the LLM.
-    """
-    if not groq_api_key:
-        return {"error": "GROQ_API_KEY not found. Please set it in your .env file."}
+QUIZ_MODEL = "llama-3.1-8b-instant"
+QUIZ_TEMPERATURE = 0.3
+# Bump whenever the quiz prompt changes so cached quizzes from the old prompt are not reused
+QUIZ_PROMPT_VERSION = 1
 
-    llm = ChatGroq(model="llama-3.1-8b-instant", groq_api_key=groq_api_key, temperature=0.3)
-    
+def _quiz_cache_key(topic, difficulty, n_questions):
+    return llm_cache.make_key(
+        "quiz",
+        topic=normalize_topic(topic),
+        difficulty=difficulty.strip().lower(),
+        n_questions=int(n_questions),
+        model=QUIZ_MODEL,
+        prompt_version=QUIZ_PROMPT_VERSION,
+        temperature=QUIZ_TEMPERATURE,
+    )
+
+def _quiz_prompt(topic, difficulty, n_questions):
     # A more detailed prompt improves the chances of getting good JSON
-    prompt = (
+    return (
         f"Generate exactly {n_questions} multiple-choice questions about the topic: '{topic}'.\n"
         f"The difficulty level should be {difficulty}.\n"
         "For each question, provide a 'question' text, an array of 4 'choices', "
@@ -34,37 +45,118 @@ def generate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5)
         '[{"question": "What is 2+2?", "choices": ["3", "4", "5", "6"], "correct_answer": 1}]'
     )
 
+def _parse_quiz(response_content, cache_key, use_cache=True):
+    # --- NEW: Robust JSON Parsing ---
+    # 1. Use a regular expression to find the JSON block (list or object)
+    json_match = re.search(r'\[.*\]|\{.*\}', response_content, re.DOTALL)
+
+    if not json_match:
+        # If no JSON is found at all, return an error with the raw response
+        return {"error": "Failed to find valid JSON in the LLM response.", "raw_response": response_content}
+
+    json_string = json_match.group(0)
+
+    # 2. Try to parse the extracted string
     try:
-        msg = HumanMessage(content=prompt)
-        resp = llm.invoke([msg])
-        response_content = resp.content
-
-        # --- NEW: Robust JSON Parsing ---
-        # 1. Use a regular expression to find the JSON block (list or object)
-        json_match = re.search(r'\[.*\]|\{.*\}', response_content, re.DOTALL)
-        
-        if not json_match:
-            # If no JSON is found at all, return an error with the raw response
-            return {"error": "Failed to find valid JSON in the LLM response.", "raw_response": response_content}
-
-        json_string = json_match.group(0)
-        
-        # 2. Try to parse the extracted string
         parsed_json = json.loads(json_string)
-        return parsed_json
-
     except json.JSONDecodeError:
         # This catches errors if the extracted string is still not valid JSON
         return {"error": "Failed to decode JSON from the LLM response.", "extracted_string": json_string}
+    # Uncached callers (the question bank) never read these back, so storing
+    # them would only evict useful entries from the shared LRU
+    if use_cache and isinstance(parsed_json, list):
+        llm_cache.set(cache_key, "quiz", parsed_json)
+    return parsed_json
+
+def generate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5, use_cache: bool = True) -> dict:
+    """
+    Generates multiple-choice questions for a given topic using an LLM.
+    This function is now more robust against formatting errors from the LLM.
+    Successful results are cached; pass use_cache=False to force a fresh quiz.
+    Blocking; request handlers use agenerate_quiz.
+    """
+    if not groq_api_key:
+        return {"error": "GROQ_API_KEY not found. Please set it in your .env file."}
+
+    cache_key = _quiz_cache_key(topic, difficulty, n_questions)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    llm = get_llm(QUIZ_MODEL, QUIZ_TEMPERATURE)
+
+    try:
+        msg = HumanMessage(content=_quiz_prompt(topic, difficulty, n_questions))
+        resp = llm.invoke([msg])
+        return _parse_quiz(resp.content, cache_key, use_cache)
     except Exception as e:
         # This catches other potential errors (e.g., API call failure)
         print(f"An unexpected error occurred in generate_quiz: {e}")
         return {"error": f"An unexpected error occurred: {str(e)}"}
 
-def seed_teaching_agent(syllabus: str, task: str):
-    teaching_agent.seed_agent(syllabus, task)
+async def agenerate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5, use_cache: bool = True) -> dict:
+    """Async generate_quiz: awaits the LLM under the concurrency limits instead of blocking a thread."""
+    if not groq_api_key:
+        return {"error": "GROQ_API_KEY not found. Please set it in your .env file."}
+
+    cache_key = _quiz_cache_key(topic, difficulty, n_questions)
+    if use_cache:
+        # The cache is SQLite-backed and takes a lock, so it stays off the event loop
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+    # Concurrent requests with the same parameters share one LLM call
+    return await single_flight.do(
+        "quiz", cache_key, lambda: _acall_quiz_llm(topic, difficulty, n_questions, cache_key, use_cache)
+    )
+
+async def _acall_quiz_llm(topic, difficulty, n_questions, cache_key, use_cache):
+    llm = get_llm(QUIZ_MODEL, QUIZ_TEMPERATURE)
+
+    try:
+        msg = HumanMessage(content=_quiz_prompt(topic, difficulty, n_questions))
+        async with llm_slot(QUIZ_MODEL):
+            resp = await llm.ainvoke([msg])
+        return await asyncio.to_thread(_parse_quiz, resp.content, cache_key, use_cache)
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred in agenerate_quiz: {e}")
+        return {"error": f"An unexpected error occurred: {str(e)}"}
+
+def seed_teaching_agent(user_id: int, syllabus: str, task: str, course: str = None):
+    instructor_sessions.seed(user_id, course, syllabus, task)
+
+# Background summarization tasks, referenced so they are not garbage-collected mid-flight
+_summary_tasks = set()
+
+def _schedule_summary(user_id: int, course: str, agent):
+    """Fold old turns into the rolling summary off the request path, then persist it."""
+    if not agent.needs_summary():
+        return
+
+    async def run():
+        if await agent.asummarize_history():
+            await asyncio.to_thread(instructor_sessions.save, user_id, course, agent)
+
+    task = asyncio.get_running_loop().create_task(run())
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+async def ainstructor_step(user_id: int, user_message: str, course: str = None):
+    agent = await asyncio.to_thread(instructor_sessions.get, user_id, course)
+    agent.human_step(user_message)
+    reply = await agent.ainstructor_step()
+    await asyncio.to_thread(instructor_sessions.save, user_id, course, agent)
+    _schedule_summary(user_id, course, agent)
+    return reply
 
-def instructor_step(user_message: str):
-    # record user message and ask instructor to respond
-    teaching_agent.human_step(user_message)
-    return teaching_agent.instructor_step()
+async def astream_instructor(user_id: int, user_message: str, course: str = None):
+    agent = await asyncio.to_thread(instructor_sessions.get, user_id, course)
+    agent.human_step(user_message)
+    async for token in agent.astream_instructor():
+        yield token
+    await asyncio.to_thread(instructor_sessions.save, user_id, course, agent)
+    _schedule_summary(user_id, course, agent)
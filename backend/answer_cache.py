@@ -0,0 +1,149 @@
+# backend/answer_cache.py
+import os
+import time
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Cosine similarity a new question needs to reuse a cached answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class _Entry:
+    def __init__(self, entry_id, shard, vector, question, answer, latency_s):
+        self.id = entry_id
+        self.shard = shard
+        self.vector = vector
+        self.question = question
+        self.answer = answer
+        self.latency_s = latency_s
+        self.created_at = time.time()
+        self.size_bytes = vector.nbytes + len(question) + len(answer) + _ENTRY_OVERHEAD_BYTES
+
+
+class _Bucket:
+    """Entries for one shard, valid for a single index version."""
+
+    def __init__(self, version):
+        self.version = version
+        self.entries = {}  # entry id -> _Entry
+        self._matrix = None
+        self._ids = []
+
+    def matrix(self):
+        if self._matrix is None:
+            self._ids = list(self.entries)
+            if self._ids:
+                self._matrix = np.vstack([self.entries[i].vector for i in self._ids])
+        return self._ids, self._matrix
+
+    def changed(self):
+        self._matrix = None
+
+
+class SemanticAnswerCache:
+    """
+    Reuses /rag_chat answers for questions whose embedding is within
+    ANSWER_CACHE_THRESHOLD cosine similarity of an earlier question in the same
+    scope (see segment_store.content_scope): learners whose shards hold the
+    same documents share a scope, older shards are scoped to themselves. A
+    scope's entries are dropped as soon as its version changes. Eviction is
+    LRU within ANSWER_CACHE_MAX_BYTES, plus a TTL checked on lookup.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl_s=ANSWER_CACHE_TTL_S, max_bytes=ANSWER_CACHE_MAX_BYTES):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._buckets = {}  # shard key -> _Bucket
+        self._lru = OrderedDict()  # entry id -> _Entry, least recently used first
+        self._bytes = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0, "latency_saved_s": 0.0}
+
+    @staticmethod
+    def _normalize(vector):
+        v = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, shard, version, query_vector):
+        """Return a cached answer for a similar question, or None."""
+        start = time.perf_counter()
+        q = self._normalize(query_vector)
+        with self._lock:
+            bucket = self._current_bucket(shard, version)
+            ids, matrix = bucket.matrix()
+            if matrix is None:
+                self.stats["misses"] += 1
+                return None
+
+            sims = matrix @ q
+            best = int(np.argmax(sims))
+            entry = bucket.entries[ids[best]]
+            if sims[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            if time.time() - entry.created_at > self.ttl_s:
+                self._remove(entry)
+                self.stats["misses"] += 1
+                return None
+
+            self._lru.move_to_end(entry.id)
+            self.stats["hits"] += 1
+            self.stats["latency_saved_s"] += max(0.0, entry.latency_s - (time.perf_counter() - start))
+            return entry.answer
+
+    def store(self, shard, version, query_vector, question, answer, latency_s):
+        with self._lock:
+            bucket = self._current_bucket(shard, version)
+            entry = _Entry(next(self._ids), shard, self._normalize(query_vector), question, answer, latency_s)
+            bucket.entries[entry.id] = entry
+            bucket.changed()
+            self._lru[entry.id] = entry
+            self._bytes += entry.size_bytes
+            while self._bytes > self.max_bytes and self._lru:
+                self._remove(next(iter(self._lru.values())))
+                self.stats["evictions"] += 1
+
+    def summary(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "latency_saved_s": round(self.stats["latency_saved_s"], 4),
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._lru),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    # ----------------------------------------------------------------
+    # Internal helpers (caller holds self._lock)
+    # ----------------------------------------------------------------
+    def _current_bucket(self, shard, version):
+        bucket = self._buckets.get(shard)
+        if bucket is not None and bucket.version != version:
+            # The shard's corpus changed: every cached answer for it is stale
+            for entry in list(bucket.entries.values()):
+                self._remove(entry)
+            self.stats["invalidations"] += 1
+            bucket = None
+        if bucket is None:
+            bucket = self._buckets[shard] = _Bucket(version)
+        return bucket
+
+    def _remove(self, entry):
+        bucket = self._buckets.get(entry.shard)
+        if bucket is not None and bucket.entries.pop(entry.id, None) is not None:
+            bucket.changed()
+            if not bucket.entries:
+                # Content scopes are never revisited once their shard changes
+                del self._buckets[entry.shard]
+        if self._lru.pop(entry.id, None) is not None:
+            self._bytes -= entry.size_bytes
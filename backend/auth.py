@@ -1,5 +1,8 @@
 # backend/auth.py
 import os
+import time
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import jwt, JWTError
@@ -9,6 +12,11 @@ load_dotenv()
 SECRET = os.getenv("JWT_SECRET", "devsecret")
 ALGO = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_EXPIRES_MINUTES = 60 * 24 * 7  # 1 week
+# Verified tokens are cached this long, so most requests skip JWT decoding and the user lookup
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# Recent auth timings kept for the percentiles in /auth_stats
+AUTH_TIMING_WINDOW = 1000
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -30,3 +38,95 @@ def decode_token(token: str):
         return payload
     except JWTError:
         return None
+
+def access_claims(user) -> dict:
+    """Signed claims for a user's token: username plus id and role, so lookups need no username query."""
+    return {"sub": user.username, "uid": user.id, "role": user.role}
+
+
+class TokenCache:
+    """
+    In-process cache of verified bearer token -> User. Entries expire after
+    AUTH_CACHE_TTL_S (never later than the token itself), the least recently
+    used are evicted past AUTH_CACHE_MAX_ENTRIES, and invalidate_user() drops
+    every cached token of a user that was changed or removed.
+    """
+
+    def __init__(self, ttl_s=AUTH_CACHE_TTL_S, max_entries=AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token -> (user, expires_at)
+        self._by_user = {}  # user id -> set of cached tokens
+        self._invalidated_at = {}  # user id -> time of the last invalidation
+        self._timings = {"hit": deque(maxlen=AUTH_TIMING_WINDOW), "miss": deque(maxlen=AUTH_TIMING_WINDOW)}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    self._drop(token)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(token)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, token, user, token_exp=None, loaded_at=None):
+        """Cache a verified user; skipped if the user was invalidated after loaded_at."""
+        now = time.time()
+        expires_at = now + self.ttl_s
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            if loaded_at is not None and self._invalidated_at.get(user.id, 0) >= loaded_at:
+                return
+            self._entries[token] = (user, expires_at)
+            self._by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._invalidated_at[user_id] = time.time()
+            for token in list(self._by_user.get(user_id, ())):
+                self._drop(token)
+            self.stats["invalidations"] += 1
+
+    def record(self, path, seconds):
+        with self._lock:
+            self._timings[path].append(seconds)
+
+    def summary(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "timings_us": {path: _percentiles_us(samples) for path, samples in self._timings.items()},
+            }
+
+    def _drop(self, token):
+        # Caller holds self._lock
+        user, _ = self._entries.pop(token)
+        tokens = self._by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user.id]
+
+
+def _percentiles_us(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6, 1)
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "mean": round(sum(ordered) / len(ordered) * 1e6, 1)}
+
+
+token_cache = TokenCache()
@@ -0,0 +1,55 @@
+# backend/backfill_topic_stats.py
+# One-off rebuild of TopicStats and the cohort score histograms from every
+# existing QuizResult row.
+# Usage: python backfill_topic_stats.py
+import time
+from sqlalchemy import text
+
+from storage import init_db, engine
+from cohort_stats import ScoreSketch
+
+# Runs as a single write transaction: the DELETE takes SQLite's write lock
+# first, so no submission can commit between clearing and re-aggregating
+BACKFILL_SQL = (
+    "INSERT INTO topicstats (user_id, topic, attempts, score_sum, score_sq_sum, best_score, last_score, last_attempt_at) "
+    "SELECT q.user_id, q.topic, COUNT(*), SUM(q.score), SUM(q.score * q.score), MAX(q.score), "
+    " (SELECT q2.score FROM quizresult q2 WHERE q2.user_id = q.user_id AND q2.topic = q.topic "
+    "  ORDER BY q2.created_at DESC, q2.id DESC LIMIT 1), "
+    " MAX(q.created_at) "
+    "FROM quizresult q GROUP BY q.user_id, q.topic"
+)
+
+
+def backfill():
+    init_db()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM topicstats"))
+        conn.execute(text(BACKFILL_SQL))
+        rows = conn.execute(text("SELECT COUNT(*), COALESCE(SUM(attempts), 0) FROM topicstats")).one()
+    print(f"Backfilled {rows[0]} user/topic rows from {rows[1]} quiz results in {time.perf_counter() - start:.2f}s")
+
+
+def backfill_cohort_bins():
+    init_db()
+    start = time.perf_counter()
+    sketches = {}
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM cohortscorebin"))
+        # Binned in Python so the boundaries match cohort_stats.bin_of exactly
+        for topic, score in conn.execute(text("SELECT topic, score FROM quizresult")):
+            sketches.setdefault(topic, ScoreSketch()).add(score)
+        rows = [
+            {"topic": topic, "bin": b, "count": count, "score_sum": score_sum}
+            for topic, sketch in sketches.items() for b, (count, score_sum) in sketch.bins.items()
+        ]
+        if rows:
+            conn.execute(text(
+                "INSERT INTO cohortscorebin (topic, bin, count, score_sum) VALUES (:topic, :bin, :count, :score_sum)"
+            ), rows)
+    print(f"Backfilled {len(rows)} histogram bins for {len(sketches)} topics in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    backfill()
+    backfill_cohort_bins()
@@ -0,0 +1,79 @@
+# backend/bench_auth.py
+# Per-request auth overhead: the old path (JWT decode + username query on every
+# request) vs. the new one (token cache hit; decode + primary-key lookup on a miss).
+# Usage: python bench_auth.py [n_requests]
+import os
+import sys
+import time
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench_auth.db')}"
+
+from sqlmodel import select
+from storage import init_db, get_session
+from models import User
+from auth import create_access_token, decode_token, access_claims, TokenCache
+
+N_USERS = 200
+
+
+def legacy_auth(token):
+    payload = decode_token(token)
+    with get_session() as s:
+        return s.exec(select(User).where(User.username == payload.get("sub"))).first()
+
+
+def cached_auth(cache, token):
+    user = cache.get(token)
+    if user is not None:
+        return user
+    payload = decode_token(token)
+    with get_session() as s:
+        user = s.get(User, payload["uid"])
+    cache.put(token, user, payload.get("exp"))
+    return user
+
+
+def timed(fn, tokens):
+    latencies = []
+    for token in tokens:
+        start = time.perf_counter()
+        fn(token)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def report(name, latencies):
+    mean_us = sum(latencies) / len(latencies) * 1e6
+    p50_us = latencies[len(latencies) // 2] * 1e6
+    p95_us = latencies[int(len(latencies) * 0.95)] * 1e6
+    print(f"{name:>22} {mean_us:>10.1f} {p50_us:>10.1f} {p95_us:>10.1f}")
+    return mean_us
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    init_db()
+    tokens = []
+    with get_session() as s:
+        for i in range(N_USERS):
+            user = User(username=f"bench_user_{i}", hashed_password="x")
+            s.add(user)
+            s.commit()
+            s.refresh(user)
+            tokens.append(create_access_token(access_claims(user)))
+    stream = [tokens[i % N_USERS] for i in range(n)]
+
+    cache = TokenCache()
+    print(f"{n} requests over {N_USERS} users")
+    print(f"{'path':>22} {'mean_us':>10} {'p50_us':>10} {'p95_us':>10}")
+    before = report("decode + query (old)", timed(legacy_auth, stream))
+    report("cache miss", timed(lambda t: cached_auth(cache, t), tokens))
+    after = report("cache hit", timed(lambda t: cached_auth(cache, t), stream))
+    print(f"speedup on cached requests: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# backend/bench_extraction.py
+# Compare PDF extractor backends and worker counts on synthetic PDFs.
+# Usage: python bench_extraction.py [n_pages ...]
+import os
+import sys
+import time
+import tempfile
+
+import pdf_extract
+from pdf_extract import EXTRACTORS, iter_pages
+
+WORKER_COUNTS = [1, 2, 4, os.cpu_count() or 1]
+LINES_PER_PAGE = 45
+
+
+def write_synthetic_pdf(path, n_pages):
+    """Write a plain-text PDF with n_pages pages of Helvetica text, no external deps."""
+    words = "gradient descent regression kernel matrix vector entropy sampling network layer".split()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # pages tree, filled in once page object ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for p in range(n_pages):
+        lines = []
+        for i in range(LINES_PER_PAGE):
+            line = " ".join(words[(p + i + j) % len(words)] for j in range(10))
+            lines.append(f"({p}.{i} {line}) Tj T*")
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td\n" + "\n".join(lines) + "\nET").encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % n_pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for i, obj in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+        xref_at = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for off in offsets:
+            f.write(b"%010d 00000 n \n" % off)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at))
+
+
+def run(path, backend, workers):
+    start = time.perf_counter()
+    n_pages = 0
+    n_chars = 0
+    for text in iter_pages(path, backend=backend, workers=workers, use_cache=False):
+        n_pages += 1
+        n_chars += len(text)
+    return time.perf_counter() - start, n_pages, n_chars
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [200, 1000]
+    worker_counts = sorted(set(WORKER_COUNTS))
+
+    print(f"{'pages':>6} {'backend':>9} {'workers':>7} {'seconds':>9} {'pages/s':>9} {'chars':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_pages in sizes:
+            path = os.path.join(tmp, f"synthetic_{n_pages}.pdf")
+            write_synthetic_pdf(path, n_pages)
+            for backend in EXTRACTORS:
+                for workers in worker_counts:
+                    seconds, pages, chars = run(path, backend, workers)
+                    print(f"{pages:>6} {backend:>9} {workers:>7} {seconds:>9.3f} {pages / seconds:>9.1f} {chars:>10}")
+
+        # Second pass over the same file is served from the page cache
+        path = os.path.join(tmp, f"synthetic_{sizes[-1]}.pdf")
+        pdf_extract.EXTRACT_CACHE_DIR = os.path.join(tmp, "cache")
+        for label in ("cold", "cached"):
+            start = time.perf_counter()
+            pages = sum(1 for _ in iter_pages(path))
+            print(f"{label:>6} run: {pages} pages in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# backend/bench_index_modes.py
+# Recall@k vs. size vs. latency for each index codec, loaded into RAM or memory-mapped.
+# Usage: python bench_index_modes.py [n_vectors] [dim]
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import faiss
+
+from index_codecs import CODECS, encode_index, read_index
+
+N_QUERIES = 200
+K_VALUES = (3, 10)
+N_CLUSTERS = 64
+
+
+def synthetic_vectors(n, d, seed=0):
+    """Clustered, L2-normalised vectors, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(N_CLUSTERS, d))
+    x = centers[rng.integers(0, N_CLUSTERS, size=n)] + 0.35 * rng.normal(size=(n, d))
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x.astype("float32")
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    d = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    vectors = synthetic_vectors(n, d)
+    queries = synthetic_vectors(N_QUERIES, d, seed=1)
+    k_max = max(K_VALUES)
+
+    flat = faiss.IndexFlatL2(d)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k_max)
+
+    header = f"{'codec':>6} {'mmap':>5} {'size_MB':>8} {'ratio':>6} " + " ".join(f"{'R@' + str(k):>6}" for k in K_VALUES)
+    print(f"{n} vectors, dim {d}, {N_QUERIES} queries")
+    print(header + f" {'load_ms':>8} {'mean_ms':>8} {'p95_ms':>8}")
+    flat_size = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in CODECS:
+            path = os.path.join(tmp, f"{codec}.faiss")
+            faiss.write_index(encode_index(flat, codec=codec, vectors=vectors), path)
+            size = os.path.getsize(path)
+            flat_size = flat_size or size
+
+            for mmap in (False, True):
+                start = time.perf_counter()
+                index = read_index(path, mmap=mmap)
+                load_ms = (time.perf_counter() - start) * 1000
+
+                latencies = []
+                found = []
+                for q in queries:
+                    start = time.perf_counter()
+                    _, ids = index.search(q.reshape(1, -1), k_max)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found.append(ids[0])
+
+                recalls = " ".join(f"{recall_at_k(found, truth, k):>6.3f}" for k in K_VALUES)
+                print(
+                    f"{codec:>6} {str(mmap):>5} {size / 1e6:>8.2f} {flat_size / size:>6.1f} {recalls} "
+                    f"{load_ms:>8.2f} {np.mean(latencies):>8.3f} {np.percentile(latencies, 95):>8.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
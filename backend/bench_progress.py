@@ -0,0 +1,124 @@
+# backend/bench_progress.py
+# Concurrent quiz submissions against SQLite: the old read-then-insert progress
+# update vs. the single-statement upsert. Reports throughput and duplicates.
+# The upsert path is the real record_quiz_result, which also maintains
+# TopicStats and the cohort score histogram, so it does more work per
+# submission than the legacy progress-only path.
+# Usage: python bench_progress.py [threads] [submissions_per_thread]
+import os
+import sys
+import time
+import tempfile
+import threading
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench_progress.db')}"
+
+from sqlalchemy import func, text
+from sqlmodel import select
+from storage import init_db, get_session, engine
+from models import Progress, QuizResult
+from progress_store import record_quiz_result, ensure_progress
+
+N_USERS = 50
+N_TOPICS = 20
+
+
+def legacy_submit(user_id, topic, score):
+    # The previous endpoint code: look the row up, insert it if missing
+    with get_session() as s:
+        s.add(QuizResult(user_id=user_id, topic=topic, score=score))
+        prog = s.exec(select(Progress).where(Progress.user_id == user_id, Progress.topic == topic)).first()
+        if not prog:
+            s.add(Progress(user_id=user_id, topic=topic, completed_percent=min(100.0, score)))
+        else:
+            prog.completed_percent = min(100.0, max(prog.completed_percent, score))
+        s.commit()
+
+
+def legacy_ensure(user_id, topic, score):
+    # The previous /generate_syllabus code: nothing is written before the read,
+    # so two requests can both miss the row and both insert it
+    with get_session() as s:
+        prog = s.exec(select(Progress).where(Progress.user_id == user_id, Progress.topic == topic)).first()
+        if not prog:
+            s.add(Progress(user_id=user_id, topic=topic, completed_percent=0.0))
+        s.commit()
+
+
+def new_ensure(user_id, topic, score):
+    ensure_progress(user_id, topic)
+
+
+def run(submit, n_threads, per_thread):
+    errors = {"count": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(n_threads)
+
+    def worker(t):
+        barrier.wait()
+        for i in range(per_thread):
+            try:
+                pair = (i * 7919 + t) % (N_USERS * N_TOPICS) if i % 2 else i // 2 % (N_USERS * N_TOPICS)
+                submit(1 + pair // N_TOPICS, f"topic {pair % N_TOPICS}", float((t * 7 + i) % 101))
+            except Exception:
+                with lock:
+                    errors["count"] += 1
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return time.perf_counter() - start, errors
+
+
+def reset():
+    # Every table the submit path writes, so each run starts from empty aggregates
+    with engine.begin() as conn:
+        for table in ("quizresult", "progress", "topicstats", "cohortscorebin"):
+            conn.execute(text(f"DELETE FROM {table}"))
+
+
+def counts():
+    with get_session() as s:
+        rows = s.exec(select(func.count(Progress.id))).one()
+        distinct = len(s.exec(select(Progress.user_id, Progress.topic).distinct()).all())
+        results = s.exec(select(func.count(QuizResult.id))).one()
+    return rows, distinct, results
+
+
+def main():
+    n_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    total = n_threads * per_thread
+    init_db()
+    with engine.connect() as conn:
+        mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+
+    print(f"{total} submissions from {n_threads} threads, {N_USERS} users x {N_TOPICS} topics, journal_mode={mode}")
+    print(f"{'path':>20} {'seconds':>8} {'subs/s':>8} {'results':>7} {'rows':>5} {'dups':>5} {'errors':>6}")
+    paths = (
+        ("submit: read+insert", legacy_submit, True),
+        ("submit: upsert", record_quiz_result, False),
+        ("start: read+insert", legacy_ensure, True),
+        ("start: upsert", new_ensure, False),
+    )
+    for name, submit, legacy in paths:
+        reset()
+        if legacy:
+            # The schema before this change: no unique (user_id, topic) index
+            with engine.begin() as conn:
+                conn.execute(text("DROP INDEX IF EXISTS ix_progress_user_topic"))
+        else:
+            init_db()
+        # Pooled connections may hold the old schema; ON CONFLICT targets are resolved against it
+        engine.dispose()
+        seconds, errors = run(submit, n_threads, per_thread)
+        rows, distinct, results = counts()
+        print(f"{name:>20} {seconds:>8.2f} {total / seconds:>8.0f} {results:>7} {rows:>5} {rows - distinct:>5} {errors['count']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# backend/cohort_stats.py
+import os
+from sqlmodel import select
+
+from storage import get_session
+from models import CohortScoreBin
+
+# Class-wide score distributions are kept as fixed-width histograms over the
+# 0-100 score range. Histograms merge by adding counts, so every submission (or
+# write-behind batch) is an upsert of a few bin rows, and medians/percentiles
+# come from at most N_BINS rows however many attempts a topic has. Quantiles
+# are exact to within one bin width.
+COHORT_BIN_WIDTH = float(os.getenv("COHORT_BIN_WIDTH", "1"))
+COHORT_HISTOGRAM_BUCKETS = int(os.getenv("COHORT_HISTOGRAM_BUCKETS", "10"))
+SCORE_MIN, SCORE_MAX = 0.0, 100.0
+N_BINS = int((SCORE_MAX - SCORE_MIN) / COHORT_BIN_WIDTH) + 1  # the last bin holds perfect scores
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def bin_of(score: float) -> int:
+    """Histogram bin for a score; out-of-range scores land in the edge bins."""
+    clamped = min(SCORE_MAX, max(SCORE_MIN, score))
+    return min(N_BINS - 1, int((clamped - SCORE_MIN) // COHORT_BIN_WIDTH))
+
+
+class ScoreSketch:
+    """A mergeable score histogram: bin -> [count, score_sum]."""
+
+    def __init__(self, bins=None):
+        self.bins = bins if bins is not None else {}
+
+    def add(self, score: float):
+        entry = self.bins.setdefault(bin_of(score), [0, 0.0])
+        entry[0] += 1
+        entry[1] += score
+        return self
+
+    def merge(self, other):
+        for b, (count, score_sum) in other.bins.items():
+            entry = self.bins.setdefault(b, [0, 0.0])
+            entry[0] += count
+            entry[1] += score_sum
+        return self
+
+    @property
+    def count(self):
+        return sum(count for count, _ in self.bins.values())
+
+    def quantile(self, q: float):
+        """Score at rank q, taken as the mean of the bin holding that rank.
+
+        The bin mean is always a value inside the observed scores, so a bin
+        with a single score reports that score exactly.
+        """
+        total = self.count
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        ordered = sorted(self.bins)
+        for b in ordered:
+            count, score_sum = self.bins[b]
+            if seen + count >= target:
+                return score_sum / count
+            seen += count
+        count, score_sum = self.bins[ordered[-1]]
+        return score_sum / count
+
+    def histogram(self, buckets=COHORT_HISTOGRAM_BUCKETS):
+        """Counts in equal-width buckets over the score range, for charting."""
+        width = (SCORE_MAX - SCORE_MIN) / buckets
+        counts = [0] * buckets
+        for b, (count, _) in self.bins.items():
+            lo = SCORE_MIN + b * COHORT_BIN_WIDTH
+            counts[min(buckets - 1, int((lo - SCORE_MIN) // width))] += count
+        return [
+            {"from": round(SCORE_MIN + i * width, 2), "to": round(SCORE_MIN + (i + 1) * width, 2), "count": c}
+            for i, c in enumerate(counts)
+        ]
+
+    def summary(self):
+        total = self.count
+        if not total:
+            return {"attempts": 0}
+        return {
+            "attempts": total,
+            "mean_score": round(sum(s for _, s in self.bins.values()) / total, 2),
+            "median": round(self.quantile(0.5), 2),
+            "quantiles": {f"p{int(q * 100)}": round(self.quantile(q), 2) for q in QUANTILES},
+            "histogram": self.histogram(),
+        }
+
+
+def load_sketches(topic: str = None):
+    """Sketches per topic from the persisted bins (one topic, or all of them)."""
+    query = select(CohortScoreBin)
+    if topic is not None:
+        query = query.where(CohortScoreBin.topic == topic)
+    with get_session() as s:
+        rows = s.exec(query).all()
+    sketches = {}
+    for r in rows:
+        sketches.setdefault(r.topic, ScoreSketch()).bins[r.bin] = [r.count, r.score_sum]
+    return sketches
+
+
+def cohort_distribution(topic: str):
+    return {"topic": topic, **load_sketches(topic).get(topic, ScoreSketch()).summary()}
+
+
+def cohort_overview():
+    return [{"topic": topic, **sketch.summary()} for topic, sketch in sorted(load_sketches().items())]
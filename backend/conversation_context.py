@@ -0,0 +1,93 @@
+# backend/conversation_context.py
+import os
+import threading
+
+# Prompt budget for the instructor: recent turns verbatim up to HISTORY_TOKENS,
+# everything older folded into a rolling summary of at most SUMMARY_TOKENS
+CONTEXT_HISTORY_TOKENS = int(os.getenv("CONTEXT_HISTORY_TOKENS", "1500"))
+CONTEXT_SYLLABUS_TOKENS = int(os.getenv("CONTEXT_SYLLABUS_TOKENS", "1500"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))
+# Summarize once at least this many turns have fallen out of the verbatim window
+CONTEXT_SUMMARY_MIN_TURNS = int(os.getenv("CONTEXT_SUMMARY_MIN_TURNS", "4"))
+
+# Llama tokenizers average roughly 4 characters per token on English text;
+# the budget only needs to be stable, not exact
+_CHARS_PER_TOKEN = 4
+
+_stats_lock = threading.Lock()
+context_stats = {"turns": 0, "prompt_tokens_total": 0, "last_prompt_tokens": 0, "max_prompt_tokens": 0,
+                 "summaries": 0, "turns_summarized": 0, "summary_failures": 0}
+
+
+def count_tokens(text):
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+def truncate_tokens(text, budget):
+    limit = budget * _CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit] + "\n[...]"
+
+def window_start(history, budget=None):
+    """Index of the oldest turn that still fits the verbatim budget (the latest turn always does)."""
+    budget = CONTEXT_HISTORY_TOKENS if budget is None else budget
+    used = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        cost = count_tokens(history[i]) + 1
+        if used + cost > budget and start < len(history):
+            break
+        used += cost
+        start = i
+    return start
+
+def build_context(syllabus, summary, history):
+    """
+    Prompt inputs for one instructor turn: the syllabus capped to its budget,
+    and the rolling summary followed by the recent turns that fit.
+    """
+    recent = history[window_start(history):]
+    parts = [f"Summary of the conversation so far: {summary}"] if summary else []
+    parts.extend(recent)
+    return truncate_tokens(syllabus, CONTEXT_SYLLABUS_TOKENS), "\n".join(parts)
+
+def record_prompt(syllabus, conversation):
+    tokens = count_tokens(syllabus) + count_tokens(conversation)
+    with _stats_lock:
+        context_stats["turns"] += 1
+        context_stats["prompt_tokens_total"] += tokens
+        context_stats["last_prompt_tokens"] = tokens
+        context_stats["max_prompt_tokens"] = max(context_stats["max_prompt_tokens"], tokens)
+    return tokens
+
+def record_summary(turns=0, failed=False):
+    with _stats_lock:
+        if failed:
+            context_stats["summary_failures"] += 1
+        else:
+            context_stats["summaries"] += 1
+            context_stats["turns_summarized"] += turns
+
+def turns_to_summarize(history):
+    """How many of the oldest turns are due to be folded into the summary (0 = not yet)."""
+    n = window_start(history)
+    return n if n >= CONTEXT_SUMMARY_MIN_TURNS else 0
+
+def summary_prompt(summary, turns):
+    earlier = summary or "(none yet)"
+    transcript = "\n".join(turn.replace("<END_OF_TURN>", "") for turn in turns)
+    return (
+        "You maintain a running summary of a tutoring conversation between a learner and an instructor.\n"
+        f"Current summary: {earlier}\n"
+        f"New turns to fold in:\n{transcript}\n"
+        f"Write the updated summary in at most {CONTEXT_SUMMARY_TOKENS * 3 // 4} words. Keep what the learner "
+        "has covered, what they struggled with and any open questions. Reply with the summary only."
+    )
+
+def summary_snapshot():
+    with _stats_lock:
+        turns = context_stats["turns"]
+        return {
+            **context_stats,
+            "avg_prompt_tokens": round(context_stats["prompt_tokens_total"] / turns, 1) if turns else 0.0,
+            "history_budget_tokens": CONTEXT_HISTORY_TOKENS,
+            "syllabus_budget_tokens": CONTEXT_SYLLABUS_TOKENS,
+        }
@@ -0,0 +1,121 @@
+# backend/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./embedding_cache.db")
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of chunk vectors keyed by
+    sha256(embedding model, chunk text), plus a record of documents that have
+    already been indexed so identical uploads can be skipped entirely.
+    Safe to share between ingestion worker processes (SQLite WAL).
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Connections must not cross a fork into ingestion worker processes
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents "
+                "(doc_hash TEXT PRIMARY KEY, chunks INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def chunk_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    # ----------------------------------------------------------------
+    # Chunk vectors
+    # ----------------------------------------------------------------
+    def embed_documents(self, embeddings, texts, stats=None):
+        """
+        Return vectors for texts, calling the embedder only for chunks not seen
+        before. Updates stats["cache_hits"], ["cache_misses"] and ["bytes_saved"].
+        """
+        model_name = getattr(embeddings, "model_name", type(embeddings).__name__)
+        keys = [self.chunk_key(model_name, t) for t in texts]
+
+        cached = {}
+        with self._lock:
+            conn = self._connect()
+            # Stay under SQLite's bound-parameter limit for large batches
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part)
+                cached.update((key, array("f", blob).tolist()) for key, blob in rows)
+
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        if misses:
+            new_vectors = embeddings.embed_documents([texts[i] for i in misses])
+            with self._lock:
+                conn = self._connect()
+                conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(keys[i], array("f", vec).tobytes()) for i, vec in zip(misses, new_vectors)],
+                )
+                conn.commit()
+            for i, vec in zip(misses, new_vectors):
+                cached[keys[i]] = vec
+
+        if stats is not None:
+            miss_set = set(misses)
+            stats["cache_hits"] = stats.get("cache_hits", 0) + len(texts) - len(misses)
+            stats["cache_misses"] = stats.get("cache_misses", 0) + len(misses)
+            stats["bytes_saved"] = stats.get("bytes_saved", 0) + sum(
+                len(t.encode("utf-8")) for i, t in enumerate(texts) if i not in miss_set
+            )
+        return [cached[key] for key in keys]
+
+    def get_vectors(self, embeddings, texts):
+        """Cached vectors for texts (None where missing), without calling the embedder."""
+        model_name = getattr(embeddings, "model_name", type(embeddings).__name__)
+        keys = [self.chunk_key(model_name, t) for t in texts]
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part)
+                found.update((key, array("f", blob).tolist()) for key, blob in rows)
+        return [found.get(key) for key in keys]
+
+    # ----------------------------------------------------------------
+    # Whole-document dedupe
+    # ----------------------------------------------------------------
+    def has_document(self, doc_hash: str) -> bool:
+        with self._lock:
+            row = self._connect().execute("SELECT 1 FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        return row is not None
+
+    def add_document(self, doc_hash: str, chunks: int):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_hash, chunks, created_at) VALUES (?, ?, ?)",
+                (doc_hash, chunks, time.time()),
+            )
+            conn.commit()
+
+
+embedding_cache = EmbeddingCache()
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from typing import List
 from dotenv import load_dotenv
 
@@ -15,10 +16,20 @@ from langchain.schema import (
 )
 
 
+from llm_cache import llm_cache, normalize_topic
+from llm_limits import llm_slot
+from llm_clients import get_llm
+from single_flight import single_flight
+
 # Load environment variables
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
+SYLLABUS_MODEL = "llama-3.1-8b-instant"
+SYLLABUS_TEMPERATURE = 0.3
+# Bump whenever the syllabus prompt changes so cached syllabi from the old prompt are not reused
+SYLLABUS_PROMPT_VERSION = 1
+
 
 # Define a Discuss agent class
 class DiscussAgent:
@@ -104,14 +115,20 @@ task_specifier_template = HumanMessagePromptTemplate.from_template(
     template=task_specifier_prompt
 )
 task_specify_agent = DiscussAgent(
-    task_specifier_sys_msg, ChatGroq(model="llama-3.1-8b-instant",groq_api_key=groq_api_key)
+    task_specifier_sys_msg, get_llm("llama-3.1-8b-instant")
 )
 
 
-# Optimized function to generate the syllabus with a single LLM call
-def generate_syllabus(topic, task):
-    llm = ChatGroq(model="llama-3.1-8b-instant", groq_api_key=groq_api_key, temperature=0.3)
+def _syllabus_cache_key(topic):
+    return llm_cache.make_key(
+        "syllabus",
+        topic=normalize_topic(topic),
+        model=SYLLABUS_MODEL,
+        prompt_version=SYLLABUS_PROMPT_VERSION,
+        temperature=SYLLABUS_TEMPERATURE,
+    )
 
+def _syllabus_messages(topic):
     prompt = f"""
     Generate a comprehensive course syllabus for the topic: "{topic}".
 
@@ -127,7 +144,39 @@ def generate_syllabus(topic, task):
     Make it detailed but concise, suitable for a beginner to intermediate level course.
     Format it in a clear, structured manner.
     """
+    return [HumanMessage(content=prompt)]
+
+
+# Optimized function to generate the syllabus with a single LLM call.
+# Results are cached per normalized topic; use_cache=False forces a fresh one.
+def generate_syllabus(topic, task, use_cache=True):
+    cache_key = _syllabus_cache_key(topic)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    llm = get_llm(SYLLABUS_MODEL, SYLLABUS_TEMPERATURE)
+    response = llm.invoke(_syllabus_messages(topic))
+    llm_cache.set(cache_key, "syllabus", response.content)
+    return response.content
+
+
+# Async variant for request handlers: waits for an LLM slot on the event loop.
+async def agenerate_syllabus(topic, task, use_cache=True):
+    cache_key = _syllabus_cache_key(topic)
+    if use_cache:
+        # The cache is SQLite-backed and takes a lock, so it stays off the event loop
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+    # A class generating the same syllabus at once shares one LLM call
+    return await single_flight.do("syllabus", cache_key, lambda: _acall_syllabus_llm(topic, cache_key))
 
-    messages = [HumanMessage(content=prompt)]
-    response = llm.invoke(messages)
+async def _acall_syllabus_llm(topic, cache_key):
+    llm = get_llm(SYLLABUS_MODEL, SYLLABUS_TEMPERATURE)
+    async with llm_slot(SYLLABUS_MODEL):
+        response = await llm.ainvoke(_syllabus_messages(topic))
+    await asyncio.to_thread(llm_cache.set, cache_key, "syllabus", response.content)
     return response.content
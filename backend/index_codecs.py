@@ -0,0 +1,131 @@
+# backend/index_codecs.py
+import os
+import faiss
+import numpy as np
+
+# How segment vectors are stored on disk / in memory:
+#   flat - exact float32 (default)
+#   fp16 - scalar-quantized to float16, half the size, near-exact recall
+#   pq   - product-quantized to PQ_M bytes per vector, lossy
+INDEX_CODEC = os.getenv("INDEX_CODEC", "flat")
+# Memory-map segment files instead of reading them into RAM, so several
+# uvicorn workers share the OS page cache for the same shard
+INDEX_MMAP = os.getenv("INDEX_MMAP", "0") == "1"
+PQ_M = int(os.getenv("PQ_M", "48"))
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+# PQ codebooks need enough training vectors; smaller segments fall back to fp16
+PQ_MIN_VECTORS = int(os.getenv("PQ_MIN_VECTORS", "4096"))
+
+# Segments with at least ANN_THRESHOLD vectors get an approximate index
+# (ANN_INDEX = ivf | hnsw) instead of brute-force search
+ANN_INDEX = os.getenv("ANN_INDEX", "ivf")
+ANN_THRESHOLD = int(os.getenv("ANN_THRESHOLD", "50000"))
+# IVF: nlist defaults to ~4*sqrt(n); k-means is trained on a random sample
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "100000"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# An ANN segment is rebuilt (and retrained) once the shard has grown this many times past it
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "2.0"))
+
+CODECS = ("flat", "fp16", "pq")
+ANN_INDEXES = ("ivf", "hnsw")
+
+
+def index_vectors(index):
+    """All vectors of an index as a float32 array (approximate for lossy codecs)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def index_kind(index):
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def _pq_m(d, m):
+    # PQ needs M to divide the dimension; take the largest divisor not above m
+    while d % m:
+        m -= 1
+    return m
+
+def _ivf_nlist(n):
+    return IVF_NLIST or max(16, int(4 * np.sqrt(n)))
+
+def _training_sample(vectors, size):
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(0).choice(len(vectors), size=size, replace=False)
+    return vectors[rows]
+
+def encode_index(index, codec=None, vectors=None, ann=None):
+    """
+    Return a new index holding the same vectors (in the same order) in the
+    chosen codec. Past ANN_THRESHOLD vectors the index is built as IVF or
+    HNSW, trained on a sample of the vectors being indexed, so every rebuild
+    (e.g. each compaction) retrains on the current corpus.
+    """
+    codec = codec or INDEX_CODEC
+    if codec not in CODECS:
+        raise ValueError(f"Unknown index codec '{codec}'. Choose one of: {', '.join(CODECS)}")
+    vectors = index_vectors(index) if vectors is None else vectors
+    d = index.d
+    n = len(vectors)
+
+    if codec == "pq" and n < PQ_MIN_VECTORS:
+        codec = "fp16"
+    storage = {"flat": "Flat", "fp16": "SQfp16", "pq": f"PQ{_pq_m(d, PQ_M)}x{PQ_NBITS}"}[codec]
+
+    ann = ann or (ANN_INDEX if n >= ANN_THRESHOLD else None)
+    if ann is not None and ann not in ANN_INDEXES:
+        raise ValueError(f"Unknown ANN index '{ann}'. Choose one of: {', '.join(ANN_INDEXES)}")
+
+    if ann == "ivf":
+        nlist = _ivf_nlist(n)
+        encoded = faiss.index_factory(d, f"IVF{nlist},{storage}")
+        encoded.train(_training_sample(vectors, max(IVF_TRAIN_SAMPLE, 40 * nlist)))
+        encoded.nprobe = IVF_NPROBE
+    elif ann == "hnsw":
+        encoded = faiss.index_factory(d, f"HNSW{HNSW_M},{storage}")
+        encoded.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        encoded.hnsw.efSearch = HNSW_EF_SEARCH
+        if not encoded.is_trained:
+            encoded.train(_training_sample(vectors, IVF_TRAIN_SAMPLE))
+    else:
+        encoded = faiss.index_factory(d, storage)
+        if not encoded.is_trained:
+            encoded.train(vectors)
+    encoded.add(vectors)
+    return encoded
+
+def search_params(index, nprobe=None, ef_search=None):
+    """Per-query search parameters, so requests can tune recall without mutating a shared index."""
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+def read_index(path, mmap=None):
+    mmap = INDEX_MMAP if mmap is None else mmap
+    if not mmap:
+        return faiss.read_index(path)
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+def resident_bytes(index, mmap=None):
+    """Private memory an index costs this process; mmapped codes live in the shared page cache."""
+    mmap = INDEX_MMAP if mmap is None else mmap
+    if mmap:
+        return 0
+    if isinstance(index, faiss.IndexHNSW):
+        # stored codes plus the 2*M level-0 neighbour links per vector
+        storage = faiss.downcast_index(index.storage)
+        return index.ntotal * (storage.sa_code_size() + index.hnsw.nb_neighbors(0) * 4)
+    return index.ntotal * index.sa_code_size()
@@ -0,0 +1,135 @@
+# backend/ingest_queue.py
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlmodel import select, update
+
+from storage import get_session
+from models import IngestJob
+from vector_store import ingest_pdf, shard_path
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# A running job refreshes updated_at every INGEST_HEARTBEAT_S; one not refreshed
+# for INGEST_LEASE_S lost its worker and may be requeued
+INGEST_HEARTBEAT_S = float(os.getenv("INGEST_HEARTBEAT_S", "15"))
+INGEST_LEASE_S = float(os.getenv("INGEST_LEASE_S", "120"))
+
+_executor = None
+
+
+# --------------------------------------------------------------------
+# API-process side
+# --------------------------------------------------------------------
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Spawned, not forked: by now the API process runs compactor/refill threads
+        # and has loaded the embedding model, and a forked child could inherit their
+        # locks (e.g. embedding_cache._lock) in a held state and deadlock
+        _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def enqueue_ingest(user_id: int, path: str, course: str = None) -> IngestJob:
+    """Record a new ingestion job and hand it to the worker pool."""
+    with get_session() as s:
+        job = IngestJob(user_id=user_id, course=course, path=path)
+        s.add(job)
+        s.commit()
+        s.refresh(job)
+    _get_executor().submit(_run_job, job.id)
+    return job
+
+def resume_pending_jobs() -> int:
+    """
+    Re-submit queued jobs and running jobs whose lease expired. Every API
+    worker calls this at startup, so jobs a live sibling is still running
+    (its heartbeat is fresh) are left alone; re-submitting a queued job is
+    harmless since only one worker can claim it.
+    """
+    now = datetime.utcnow()
+    with get_session() as s:
+        s.exec(
+            update(IngestJob)
+            .where(IngestJob.status == "running", IngestJob.updated_at < now - timedelta(seconds=INGEST_LEASE_S))
+            .values(status="queued", stage="queued", pages_processed=0, chunks_embedded=0, updated_at=now)
+        )
+        s.commit()
+        job_ids = s.exec(select(IngestJob.id).where(IngestJob.status == "queued")).all()
+
+    for job_id in job_ids:
+        _get_executor().submit(_run_job, job_id)
+    if job_ids:
+        print(f"Resumed {len(job_ids)} pending ingestion job(s)")
+    return len(job_ids)
+
+def get_job(job_id: int):
+    with get_session() as s:
+        return s.get(IngestJob, job_id)
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --------------------------------------------------------------------
+# Worker-process side
+# --------------------------------------------------------------------
+def _update_job(job_id: int, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    with get_session() as s:
+        s.exec(update(IngestJob).where(IngestJob.id == job_id).values(**fields))
+        s.commit()
+
+def _claim_job(job_id: int) -> bool:
+    # Only one worker may move a job from queued to running
+    with get_session() as s:
+        result = s.exec(
+            update(IngestJob)
+            .where(IngestJob.id == job_id, IngestJob.status == "queued")
+            .values(status="running", stage="embedding", updated_at=datetime.utcnow())
+        )
+        s.commit()
+        return result.rowcount == 1
+
+def _run_job(job_id: int):
+    if not _claim_job(job_id):
+        return
+
+    job = get_job(job_id)
+
+    def on_progress(stage, stats):
+        _update_job(job_id, stage=stage, pages_processed=stats["pages"], chunks_embedded=stats["chunks"])
+
+    # Keep the lease alive even through long extraction or embedding steps
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(INGEST_HEARTBEAT_S):
+            _update_job(job_id)
+
+    threading.Thread(target=heartbeat, name=f"ingest-heartbeat-{job_id}", daemon=True).start()
+    try:
+        stats = ingest_pdf(
+            job.path,
+            index_path=shard_path(job.user_id, job.course),
+            on_progress=on_progress,
+        )
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        _update_job(job_id, status="failed", stage="failed", error=str(e))
+        return
+    finally:
+        done.set()
+
+    _update_job(
+        job_id,
+        status="done",
+        stage="done",
+        pages_processed=stats["pages"],
+        chunks_embedded=stats["chunks"],
+        duplicate=stats["duplicate"],
+        cache_hit_rate=stats["hit_rate"],
+        bytes_saved=stats["bytes_saved"],
+    )
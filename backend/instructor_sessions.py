@@ -0,0 +1,147 @@
+# backend/instructor_sessions.py
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlmodel import select
+
+from storage import get_session, upsert_insert
+from models import InstructorSession
+from teaching_agent import new_teaching_agent
+
+# Active sessions kept in memory per worker; the rest live only in the database
+INSTRUCTOR_MAX_SESSIONS = int(os.getenv("INSTRUCTOR_MAX_SESSIONS", "1000"))
+# Sessions untouched this long are dropped from memory (they are already persisted)
+INSTRUCTOR_SESSION_IDLE_S = float(os.getenv("INSTRUCTOR_SESSION_IDLE_S", "1800"))
+
+
+class _Active:
+    def __init__(self, agent, version):
+        self.agent = agent
+        self.version = version  # updated_at of the row this copy reflects
+        self.last_used = time.monotonic()
+
+# Version of a session that has never been saved
+_UNSAVED = datetime.min
+
+
+class InstructorSessionStore:
+    """
+    Per-learner instructor agents keyed on (user_id, course). Every completed
+    turn is written through to the InstructorSession table, so evicting a
+    session from the in-memory LRU never loses state: the next message
+    rehydrates it from the database. Memory is bounded by
+    INSTRUCTOR_MAX_SESSIONS no matter how many users there are.
+    A resident copy is reused only while the row's updated_at is no newer than
+    the copy, so turns saved or syllabi seeded by other workers are picked up.
+    """
+
+    def __init__(self, max_sessions=INSTRUCTOR_MAX_SESSIONS, idle_s=INSTRUCTOR_SESSION_IDLE_S):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self._sessions = OrderedDict()  # (user_id, course) -> _Active, least recently used first
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "rehydrated": 0, "created": 0, "stale_reloads": 0, "evicted_idle": 0, "evicted_lru": 0}
+
+    @staticmethod
+    def _key(user_id, course):
+        return (user_id, course or "")
+
+    def get(self, user_id, course=None):
+        """Return the learner's agent, loading it from the database if it is not resident."""
+        key = self._key(user_id, course)
+        with self._lock:
+            self._evict_idle()
+            active = self._sessions.get(key)
+        if active is not None:
+            version = self._row_version(key)
+            if version is None or version <= active.version:
+                with self._lock:
+                    active.last_used = time.monotonic()
+                    if key in self._sessions:
+                        self._sessions.move_to_end(key)
+                    self.stats["hits"] += 1
+                return active.agent
+            # Another worker saved or re-seeded this session since we cached it
+            self.stats["stale_reloads"] += 1
+
+        agent, version = self._load(key)
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep the newest copy
+            active = self._sessions.get(key)
+            if active is None or active.version < version:
+                active = self._sessions[key] = _Active(agent, version)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats["evicted_lru"] += 1
+            return active.agent
+
+    def save(self, user_id, course, agent):
+        key = self._key(user_id, course)
+        now = datetime.utcnow()
+        stmt = upsert_insert(InstructorSession).values(
+            user_id=key[0],
+            course=key[1],
+            syllabus=agent.syllabus,
+            topic=agent.conversation_topic,
+            history=json.dumps(agent.conversation_history),
+            summary=agent.summary,
+            updated_at=now,
+        )
+        # Single-statement upsert on the (user_id, course) unique index
+        columns = ("syllabus", "topic", "history", "summary", "updated_at")
+        with get_session() as s:
+            s.connection().execute(stmt.on_conflict_do_update(
+                index_elements=["user_id", "course"],
+                set_={c: stmt.excluded[c] for c in columns},
+            ))
+            s.commit()
+        with self._lock:
+            active = self._sessions.get(key)
+            if active is not None and active.agent is agent:
+                active.version = max(active.version, now)
+
+    def seed(self, user_id, course, syllabus, task):
+        """Start a fresh conversation around a syllabus."""
+        agent = self.get(user_id, course)
+        agent.seed_agent(syllabus, task)
+        self.save(user_id, course, agent)
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, "resident": len(self._sessions), "max_sessions": self.max_sessions}
+
+    @staticmethod
+    def _where(key):
+        user_id, course = key
+        return (InstructorSession.user_id == user_id, InstructorSession.course == course)
+
+    def _row_version(self, key):
+        with get_session() as s:
+            return s.exec(select(InstructorSession.updated_at).where(*self._where(key))).first()
+
+    def _load(self, key):
+        """(agent, version) from the database, or a fresh agent if the session was never saved."""
+        with get_session() as s:
+            row = s.exec(select(InstructorSession).where(*self._where(key))).first()
+        if row is None:
+            self.stats["created"] += 1
+            return new_teaching_agent(), _UNSAVED
+        self.stats["rehydrated"] += 1
+        return new_teaching_agent(row.syllabus, row.topic, json.loads(row.history), row.summary), row.updated_at
+
+    def _evict_idle(self):
+        # Caller holds self._lock; the LRU order is also idle order
+        cutoff = time.monotonic() - self.idle_s
+        while self._sessions:
+            key, active = next(iter(self._sessions.items()))
+            if active.last_used >= cutoff:
+                break
+            del self._sessions[key]
+            self.stats["evicted_idle"] += 1
+
+
+instructor_sessions = InstructorSessionStore()
@@ -0,0 +1,102 @@
+# backend/lexical_index.py
+import os
+import re
+import gzip
+import json
+import math
+from collections import Counter, defaultdict
+
+# BM25 postings are stored per segment, next to the segment's FAISS files,
+# so adding a document only writes postings for that document. Corpus-wide
+# statistics (N, average length, document frequency) are combined from
+# per-segment totals at query time, so a query costs O(segments) plus the
+# postings of its terms, not O(corpus).
+LEXICAL_FILE = "lexical.json.gz"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class LexicalSegment:
+    """Inverted index over the chunks of one segment, in the segment's vector order."""
+
+    def __init__(self, doc_lens, postings):
+        self.doc_lens = doc_lens  # token count per chunk
+        self.postings = postings  # term -> (positions, term frequencies)
+        # Segments are immutable, so their totals are computed once on build/load
+        self.n_docs = len(doc_lens)
+        self.total_len = sum(doc_lens)
+
+    @classmethod
+    def build(cls, texts):
+        doc_lens = []
+        postings = defaultdict(lambda: ([], []))
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                positions, tfs = postings[term]
+                positions.append(pos)
+                tfs.append(tf)
+        return cls(doc_lens, dict(postings))
+
+    def save(self, dir_path):
+        # Positions are delta-encoded so long posting lists compress well
+        encoded = {
+            term: [[p - prev for p, prev in zip(positions, [0] + positions[:-1])], tfs]
+            for term, (positions, tfs) in self.postings.items()
+        }
+        with gzip.open(os.path.join(dir_path, LEXICAL_FILE), "wt", encoding="utf-8") as f:
+            json.dump({"doc_lens": self.doc_lens, "postings": encoded}, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, dir_path):
+        path = os.path.join(dir_path, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {}
+        for term, (deltas, tfs) in data["postings"].items():
+            positions = []
+            total = 0
+            for delta in deltas:
+                total += delta
+                positions.append(total)
+            postings[term] = (positions, tfs)
+        return cls(data["doc_lens"], postings)
+
+
+def bm25_search(lexical_segments, query, k):
+    """
+    Score query terms over a list of LexicalSegment (None entries are skipped).
+    Returns up to k (segment index, position, score) tuples, best first.
+    """
+    terms = set(tokenize(query))
+    live = [(i, seg) for i, seg in enumerate(lexical_segments) if seg is not None]
+    n_docs = sum(seg.n_docs for _, seg in live)
+    if not terms or n_docs == 0:
+        return []
+    avg_len = sum(seg.total_len for _, seg in live) / n_docs
+
+    scores = defaultdict(float)
+    for term in terms:
+        df = sum(len(seg.postings[term][0]) for _, seg in live if term in seg.postings)
+        if df == 0:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for i, seg in live:
+            if term not in seg.postings:
+                continue
+            positions, tfs = seg.postings[term]
+            for pos, tf in zip(positions, tfs):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * seg.doc_lens[pos] / avg_len)
+                scores[(i, pos)] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(i, pos, score) for (i, pos), score in best]
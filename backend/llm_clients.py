@@ -0,0 +1,137 @@
+# backend/llm_clients.py
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from langchain_groq import ChatGroq
+
+load_dotenv()
+groq_api_key = os.getenv("GROQ_API_KEY")
+
+# Timeouts and retries for every LLM call (retries back off on 429/5xx/connection errors)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# One keep-alive connection pool per worker, shared by all models
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY_S", "30"))
+
+
+class LLMClientRegistry:
+    """
+    Long-lived ChatGroq clients, one per (model, temperature), all sharing a
+    single sync and a single async httpx connection pool so requests reuse
+    keep-alive connections instead of paying TCP/TLS setup each time.
+    """
+
+    def __init__(self):
+        self._llms = {}  # (model, temperature) -> ChatGroq
+        self._http = None
+        self._ahttp = None
+        self._lock = threading.Lock()
+        self.stats = {"clients": 0, "requests": 0, "responses": 0, "errors_4xx": 0, "errors_5xx": 0}
+
+    def _timeout(self):
+        return httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY_S,
+        )
+
+    def _on_request(self, request):
+        self.stats["requests"] += 1
+
+    def _on_response(self, response):
+        self.stats["responses"] += 1
+        if 400 <= response.status_code < 500:
+            self.stats["errors_4xx"] += 1
+        elif response.status_code >= 500:
+            self.stats["errors_5xx"] += 1
+
+    async def _aon_request(self, request):
+        self._on_request(request)
+
+    async def _aon_response(self, response):
+        self._on_response(response)
+
+    def _clients(self):
+        # Caller holds self._lock
+        if self._http is None:
+            self._http = httpx.Client(
+                timeout=self._timeout(), limits=self._limits(),
+                event_hooks={"request": [self._on_request], "response": [self._on_response]},
+            )
+            self._ahttp = httpx.AsyncClient(
+                timeout=self._timeout(), limits=self._limits(),
+                event_hooks={"request": [self._aon_request], "response": [self._aon_response]},
+            )
+        return self._http, self._ahttp
+
+    def get(self, model, temperature=None):
+        """Return the shared client for this model and temperature (None = provider default)."""
+        key = (model, temperature)
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                http, ahttp = self._clients()
+                kwargs = {} if temperature is None else {"temperature": temperature}
+                llm = ChatGroq(
+                    model=model,
+                    groq_api_key=groq_api_key,
+                    timeout=self._timeout(),
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=http,
+                    http_async_client=ahttp,
+                    **kwargs,
+                )
+                self._llms[key] = llm
+                self.stats["clients"] = len(self._llms)
+            return llm
+
+    def summary(self):
+        with self._lock:
+            pools = {"sync": _pool_usage(self._http), "async": _pool_usage(self._ahttp)}
+            return {
+                **self.stats,
+                "models": sorted(f"{model}@{temperature}" for model, temperature in self._llms),
+                "pool": pools,
+                "max_connections": LLM_POOL_MAX_CONNECTIONS,
+                "max_keepalive": LLM_POOL_MAX_KEEPALIVE,
+                "timeout_s": LLM_TIMEOUT_S,
+                "max_retries": LLM_MAX_RETRIES,
+            }
+
+    def close(self):
+        with self._lock:
+            http, self._http = self._http, None
+            self._llms.clear()
+        if http is not None:
+            http.close()
+
+    async def aclose(self):
+        with self._lock:
+            ahttp, self._ahttp = self._ahttp, None
+        if ahttp is not None:
+            await ahttp.aclose()
+        self.close()
+
+
+def _pool_usage(client):
+    """Open / idle connection counts, read from httpx's transport pool."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    return {
+        "open": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+    }
+
+
+llm_clients = LLMClientRegistry()
+
+
+def get_llm(model, temperature=None):
+    return llm_clients.get(model, temperature)
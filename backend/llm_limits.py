@@ -0,0 +1,98 @@
+# backend/llm_limits.py
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
+# Upper bound on LLM calls in flight per worker process, across all models
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+# Default per-model bound, overridable per model: LLM_MODEL_CONCURRENCY="llama-3.1-8b-instant=128,other=16"
+LLM_PER_MODEL_CONCURRENCY = int(os.getenv("LLM_PER_MODEL_CONCURRENCY", "128"))
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+# How long a request may wait for a slot before it is rejected (0 = wait forever)
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+
+
+class LLMOverloaded(Exception):
+    """No LLM slot became free within LLM_QUEUE_TIMEOUT_S."""
+
+
+def _parse_model_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, limit = item.split("=", 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class ConcurrencyLimiter:
+    """
+    Global and per-model semaphores for async LLM calls. Requests over the
+    limit wait on the event loop (no thread is held while they wait).
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, per_model=LLM_PER_MODEL_CONCURRENCY,
+                 model_limits=None, queue_timeout_s=LLM_QUEUE_TIMEOUT_S):
+        self.max_concurrency = max_concurrency
+        self.per_model = per_model
+        self.model_limits = _parse_model_limits(LLM_MODEL_CONCURRENCY) if model_limits is None else model_limits
+        self.queue_timeout_s = queue_timeout_s
+        self._global = None
+        self._models = {}  # model -> asyncio.Semaphore
+        self.stats = {"in_flight": 0, "waiting": 0, "peak_in_flight": 0, "completed": 0, "rejected": 0}
+
+    def _semaphores(self, model):
+        # Created lazily so they bind to the running event loop
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        if model not in self._models:
+            self._models[model] = asyncio.Semaphore(self.model_limits.get(model, self.per_model))
+        return self._global, self._models[model]
+
+    async def _acquire(self, sem):
+        if self.queue_timeout_s > 0:
+            await asyncio.wait_for(sem.acquire(), self.queue_timeout_s)
+        else:
+            await sem.acquire()
+
+    @asynccontextmanager
+    async def slot(self, model):
+        global_sem, model_sem = self._semaphores(model)
+        self.stats["waiting"] += 1
+        try:
+            await self._acquire(model_sem)
+            try:
+                await self._acquire(global_sem)
+            except BaseException:
+                model_sem.release()
+                raise
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise LLMOverloaded(f"Too many concurrent requests for {model}; try again shortly")
+        finally:
+            self.stats["waiting"] -= 1
+
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        try:
+            yield
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["completed"] += 1
+            global_sem.release()
+            model_sem.release()
+
+    def summary(self):
+        return {
+            **self.stats,
+            "max_concurrency": self.max_concurrency,
+            "per_model": {model: self.model_limits.get(model, self.per_model) for model in self._models},
+        }
+
+
+llm_limiter = ConcurrencyLimiter()
+
+
+def llm_slot(model):
+    """async with llm_slot(model): ... -- hold one global and one per-model slot."""
+    return llm_limiter.slot(model)
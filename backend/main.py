@@ -1,18 +1,34 @@
 # backend/main.py
-import os
+import time
+import logging
+import asyncio
+from typing import Optional
 from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from sqlmodel import select
+from sqlalchemy import event
 from storage import init_db, get_session, save_uploaded_file
-from models import User, Progress, QuizResult
-from auth import hash_password, verify_password, create_access_token, decode_token
+from models import User, Progress
+from auth import hash_password, verify_password, create_access_token, decode_token, access_claims, token_cache
 import agents
-from vector_store import add_pdf_to_vectorstore
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import FastEmbedEmbeddings
-from langchain.chains import RetrievalQA
-from langchain_groq import ChatGroq
+import question_bank
+import progress_store
+import cohort_stats
+import quiz_store
+import ingest_queue
+from retriever import RetrieverService, RAG_MODEL, aanswer, astream_answer
+from segment_store import Compactor, content_scope
+from vector_store import VECTOR_DB_DIR, get_embeddings, shard_key, shard_path
+from answer_cache import SemanticAnswerCache
+from llm_cache import llm_cache
+from instructor_sessions import instructor_sessions
+from conversation_context import summary_snapshot as context_summary
+from llm_limits import llm_limiter, llm_slot, LLMOverloaded
+from llm_clients import llm_clients
+from single_flight import single_flight
+from streaming import sse_event, StreamTimer, stream_stats
 from pydantic import BaseModel
 
 
@@ -21,6 +37,7 @@ load_dotenv()
 init_db()
 
 app = FastAPI(title="LearnWise Backend")
+logger = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,24 +47,114 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# Bank fills always want fresh questions, never a cached quiz
+def generate_bank_questions(topic: str, difficulty: str, n_questions: int):
+    return agents.generate_quiz(topic, difficulty, n_questions, use_cache=False)
+
+async def agenerate_bank_questions(topic: str, difficulty: str, n_questions: int):
+    return await agents.agenerate_quiz(topic, difficulty, n_questions, use_cache=False)
+
+# Warm RAG state shared by every /rag_chat request in this process
+retriever_service = RetrieverService()
+# Merges small index segments in the background
+compactor = Compactor(VECTOR_DB_DIR, get_embeddings)
+# Answers reused for near-identical questions against the same index version
+answer_cache = SemanticAnswerCache()
+
+@app.on_event("startup")
+def warm_retriever():
+    retriever_service.warm_up()
+
+@app.on_event("startup")
+def resume_ingest_jobs():
+    ingest_queue.resume_pending_jobs()
+
+@app.on_event("startup")
+def start_compactor():
+    compactor.start()
+
+@app.on_event("startup")
+def start_question_bank_refill():
+    question_bank.start_refill_worker(generate_bank_questions)
+
+@app.on_event("shutdown")
+def stop_question_bank_refill():
+    question_bank.stop_refill_worker()
+
+@app.on_event("startup")
+def start_quiz_writer():
+    progress_store.quiz_writer.start()
+
+@app.on_event("shutdown")
+def flush_quiz_writer():
+    progress_store.quiz_writer.stop()
+
+@app.on_event("shutdown")
+def stop_ingest_workers():
+    ingest_queue.shutdown()
+
+@app.on_event("shutdown")
+def stop_compactor():
+    compactor.stop()
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await llm_clients.aclose()
+
 # --------------------------------------------------------------------
 # Helper to extract user from Bearer token
 # --------------------------------------------------------------------
-def get_current_user(authorization: str = Header(None)):
+def _load_user(payload: dict):
+    with get_session() as s:
+        if "uid" in payload:
+            # Primary-key lookup; the username check guards against a reused id
+            user = s.get(User, payload["uid"])
+            return user if user and user.username == payload.get("sub") else None
+        # Tokens issued before uid/role were added to the claims
+        return s.exec(select(User).where(User.username == payload.get("sub"))).first()
+
+async def get_current_user(authorization: str = Header(None)):
+    start = time.perf_counter()
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 
     token = authorization.split(" ")[1]
+    # Fast path: a token verified recently needs neither JWT decoding nor a database query
+    user = token_cache.get(token)
+    if user is not None:
+        token_cache.record("hit", time.perf_counter() - start)
+        return user
+
     payload = decode_token(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    username = payload.get("sub")
-    with get_session() as s:
-        user = s.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+    loaded_at = time.time()
+    user = await asyncio.to_thread(_load_user, payload)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    token_cache.put(token, user, payload.get("exp"), loaded_at=loaded_at)
+    token_cache.record("miss", time.perf_counter() - start)
+    return user
+
+INSTRUCTOR_ROLES = ("instructor", "admin")
+
+def require_instructor(user: User = Depends(get_current_user)):
+    if user.role not in INSTRUCTOR_ROLES:
+        raise HTTPException(status_code=403, detail="Instructor role required")
+    return user
+
+# Changing or deleting a user drops its cached tokens in this process; other
+# workers pick the change up within AUTH_CACHE_TTL_S. Bulk UPDATE/DELETE
+# statements bypass these events and should call token_cache.invalidate_user.
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_tokens(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
 
 # --------------------------------------------------------------------
 # Auth endpoints
@@ -62,7 +169,7 @@ def signup(username: str, password: str):
         s.add(user)
         s.commit()
         s.refresh(user)
-        token = create_access_token({"sub": username})
+        token = create_access_token(access_claims(user))
         return {"token": token, "username": username}
 
 @app.post("/login")
@@ -71,7 +178,7 @@ def login(username: str, password: str):
         user = s.exec(select(User).where(User.username == username)).first()
         if not user or not verify_password(password, user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        token = create_access_token({"sub": username})
+        token = create_access_token(access_claims(user))
         return {"token": token, "username": username}
 
 # --------------------------------------------------------------------
@@ -80,114 +187,257 @@ def login(username: str, password: str):
 @app.post("/upload_pdf")
 def api_upload_pdf(
     file: UploadFile = File(...),
+    course: Optional[str] = None,
     user: User = Depends(get_current_user)
 ):
     path = save_uploaded_file(file.file, file.filename)
 
-    # Add PDF content to vector DB
-    n_chunks = add_pdf_to_vectorstore(path)
-
-    return {"path": path, "chunks_added": n_chunks}
+    # Extraction, embedding and indexing run in the ingestion worker pool
+    job = ingest_queue.enqueue_ingest(user.id, path, course)
+
+    return {"path": path, "filename": file.filename, "job_id": job.id, "status": job.status}
+
+@app.get("/ingest_status/{job_id}")
+def api_ingest_status(job_id: int, user: User = Depends(get_current_user)):
+    job = ingest_queue.get_job(job_id)
+    if not job or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "pages_processed": job.pages_processed,
+        "chunks_embedded": job.chunks_embedded,
+        "duplicate": job.duplicate,
+        "cache_hit_rate": job.cache_hit_rate,
+        "bytes_saved": job.bytes_saved,
+        "error": job.error,
+    }
 
 
 @app.post("/generate_syllabus")
-def api_generate_syllabus(topic: str, user: User = Depends(get_current_user)):
+async def api_generate_syllabus(topic: str, course: Optional[str] = None, no_cache: bool = False, user: User = Depends(get_current_user)):
     task = f"Generate a course syllabus to teach the topic: {topic}"
-    syllabus = agents.gen_syllabus(topic, task)
-    with get_session() as s:
-        prog = s.exec(select(Progress).where(Progress.user_id == user.id, Progress.topic == topic)).first()
-        if not prog:
-            prog = Progress(user_id=user.id, topic=topic, completed_percent=0.0)
-            s.add(prog)
-        s.commit()
+    syllabus = await agents.agen_syllabus(topic, task, use_cache=not no_cache)
+    await asyncio.to_thread(progress_store.ensure_progress, user.id, topic)
+    # The learner's instructor session now teaches from this syllabus
+    await asyncio.to_thread(agents.seed_teaching_agent, user.id, syllabus, task, course)
     return {"syllabus": syllabus}
 
 @app.post("/generate_quiz")
-def api_generate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5, user: User = Depends(get_current_user)):
-    quiz = agents.generate_quiz(topic, difficulty, n_questions)
-    return {"quiz": quiz}
-
-@app.post("/submit_quiz")
-def api_submit_quiz(topic: str, score: float, user: User = Depends(get_current_user)):
-    with get_session() as s:
-        qr = QuizResult(user_id=user.id, topic=topic, score=score)
-        s.add(qr)
-        prog = s.exec(select(Progress).where(Progress.user_id == user.id, Progress.topic == topic)).first()
-        if not prog:
-            prog = Progress(user_id=user.id, topic=topic, completed_percent=min(100.0, score))
-            s.add(prog)
-        else:
-            prog.completed_percent = min(100.0, max(prog.completed_percent, score))
-        s.commit()
-    return {"ok": True}
+async def api_generate_quiz(topic: str, difficulty: str = "medium", n_questions: int = 5, no_cache: bool = False, user: User = Depends(get_current_user)):
+    if no_cache:
+        quiz = await agents.agenerate_quiz(topic, difficulty, n_questions, use_cache=False)
+    else:
+        # Served from the question bank; the LLM is only called for a shortfall
+        quiz = await question_bank.aassemble_quiz(user.id, topic, difficulty, n_questions, agenerate_bank_questions)
+    if not isinstance(quiz, list):
+        return {"quiz": quiz}
+    # The answer key stays on the server; submissions refer to the quiz by id
+    quiz_id, questions = await asyncio.to_thread(quiz_store.issue_quiz, user.id, topic, difficulty, quiz)
+    if quiz_id is None:
+        return {"quiz": {"error": "The generated quiz had no usable questions."}}
+    return {"quiz_id": quiz_id, "quiz": questions}
 
 class SubmitQuizRequest(BaseModel):
-    topic: str
-    quiz: list
+    quiz_id: int
     answers: list[int]
 
 @app.post("/submit_quiz_answers")
 def api_submit_quiz_answers(request: SubmitQuizRequest, user: User = Depends(get_current_user)):
-    quiz = request.quiz
-    answers = request.answers
-    topic = request.topic
+    quiz = quiz_store.get_quiz(user.id, request.quiz_id)
+    if quiz is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
 
-    if len(answers) != len(quiz):
+    if len(request.answers) != quiz_store.question_count(quiz):
         raise HTTPException(status_code=400, detail="Number of answers must match number of questions")
 
-    correct = 0
-    for i, q in enumerate(quiz):
-        if answers[i] == q["correct_answer"]:
-            correct += 1
+    if not quiz_store.mark_submitted(quiz.id):
+        raise HTTPException(status_code=409, detail="Quiz already submitted")
 
-    score = (correct / len(quiz)) * 100
+    # Graded against the stored key, never against anything the client sent
+    correct, total = quiz_store.grade(quiz, request.answers)
+    score = (correct / total) * 100
 
-    with get_session() as s:
-        qr = QuizResult(user_id=user.id, topic=topic, score=score)
-        s.add(qr)
-        prog = s.exec(select(Progress).where(Progress.user_id == user.id, Progress.topic == topic)).first()
-        if not prog:
-            prog = Progress(user_id=user.id, topic=topic, completed_percent=min(100.0, score))
-            s.add(prog)
-        else:
-            prog.completed_percent = min(100.0, max(prog.completed_percent, score))
-        s.commit()
+    try:
+        progress_store.quiz_writer.submit(user.id, quiz.topic, score)
+    except Exception:
+        # Nothing was recorded, so let the learner submit this quiz again
+        quiz_store.release_submission(quiz.id)
+        raise
 
-    return {"score": score, "correct": correct, "total": len(quiz)}
+    return {"quiz_id": quiz.id, "score": score, "correct": correct, "total": total}
 
 @app.post("/chat")
-def api_chat(message: str, user: User = Depends(get_current_user)):
-    response = agents.instructor_step(message)
+async def api_chat(message: str, course: Optional[str] = None, user: User = Depends(get_current_user)):
+    response = await agents.ainstructor_step(user.id, message, course)
     return {"response": response}
 
+def _sse_response(endpoint, tokens, on_complete=None, **done_fields):
+    """
+    Stream an async iterator of tokens as server-sent events: one "token"
+    event per chunk, then "done" with the timings (or "error").
+    """
+    async def events():
+        timer = StreamTimer()
+        parts = []
+        try:
+            async for token in tokens:
+                timer.token()
+                parts.append(token)
+                yield sse_event({"token": token}, event="token")
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-band
+            logger.exception("%s stream failed", endpoint)
+            yield sse_event({"error": str(e)}, event="error")
+            return
+        timing = timer.finish()
+        stream_stats.record(endpoint, timing)
+        if on_complete is not None:
+            on_complete("".join(parts), timing)
+        yield sse_event({**timing, **done_fields}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/chat_stream")
+async def api_chat_stream(message: str, course: Optional[str] = None, user: User = Depends(get_current_user)):
+    return _sse_response("/chat_stream", agents.astream_instructor(user.id, message, course))
+
 @app.get("/progress")
 def api_progress(user: User = Depends(get_current_user)):
+    # Submissions still in the write-behind buffer count as the user's own writes
+    pending = progress_store.quiz_writer.pending_for(user.id)
     with get_session() as s:
         rows = s.exec(select(Progress).where(Progress.user_id == user.id)).all()
-        return {"progress": [r.dict() for r in rows]}
+        progress = [r.dict() for r in rows]
+    return {"progress": progress_store.merge_pending_progress(user.id, progress, pending)}
+
+@app.get("/stats")
+def api_stats(user: User = Depends(get_current_user)):
+    """Per-topic attempts, mean, spread, best, last score and trend for the caller."""
+    stats = progress_store.quiz_writer.read_with_pending(user.id, lambda pending: progress_store.topic_stats(user.id, pending))
+    return {"stats": stats}
+
+@app.get("/cohort_stats")
+def api_cohort_stats(topic: Optional[str] = None, user: User = Depends(require_instructor)):
+    """Class-wide score distribution (median, quantiles, histogram) for a topic, or for every topic."""
+    # Read from the per-topic histograms; write-behind submissions appear once flushed
+    if topic is not None:
+        return cohort_stats.cohort_distribution(topic)
+    return {"topics": cohort_stats.cohort_overview()}
+
+@app.get("/quiz_writer_stats")
+def api_quiz_writer_stats(user: User = Depends(get_current_user)):
+    return progress_store.quiz_writer.summary()
 
 class ChatRequest(BaseModel):
     message: str
+    course: Optional[str] = None
+    # ANN search depth overrides (only used once a shard has an IVF/HNSW index)
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
 
 @app.post("/rag_chat")
-def rag_chat(request: ChatRequest, user: User = Depends(get_current_user)):
+async def rag_chat(request: ChatRequest, user: User = Depends(get_current_user)):
     """Chat with uploaded PDFs using RAG (retrieval-augmented generation)."""
-    from vector_store import VECTOR_DB_PATH
+    # Read the scope before retrieval so an answer is never filed under newer content.
+    # Learners whose shards hold the same documents share one scope, and so share answers.
+    scope = await asyncio.to_thread(content_scope, shard_path(user.id, request.course), shard_key(user.id, request.course))
+
+    # Retrieval only ever searches the caller's own shard
+    # Shard loading and query embedding are blocking, so they run off the event loop
+    qa_chain = await asyncio.to_thread(
+        retriever_service.get_chain, user.id, request.course, nprobe=request.nprobe, ef_search=request.ef_search
+    )
+    if qa_chain is None:
+        raise HTTPException(status_code=400, detail="No PDFs indexed yet. Please upload first.")
 
-    if not os.path.exists(VECTOR_DB_PATH):
+    # Answers are only shared for default search settings
+    use_cache = scope is not None and not (request.nprobe or request.ef_search)
+    query_vector = None
+    if use_cache:
+        query_vector = await asyncio.to_thread(retriever_service.embed_query, request.message)
+        cached = answer_cache.lookup(*scope, query_vector)
+        if cached is not None:
+            return {"response": cached, "cached": True}
+
+    async def answer():
+        start = time.perf_counter()
+        async with llm_slot(RAG_MODEL):
+            # Retrieval reuses the lookup's query vector instead of embedding again
+            result = await aanswer(qa_chain, request.message, query_vector)
+        if use_cache:
+            answer_cache.store(*scope, query_vector, request.message, result, time.perf_counter() - start)
+        return result
+
+    # Identical concurrent questions over the same content share one chain run;
+    # uncached requests stay per shard since their search settings differ
+    flight_scope = scope if use_cache else (shard_key(user.id, request.course), None)
+    flight_key = (*flight_scope, " ".join(request.message.split()), request.nprobe, request.ef_search)
+    result = await single_flight.do("rag_chat", flight_key, answer)
+    return {"response": result, "cached": False}
+
+async def _single_token(text):
+    yield text
+
+@app.post("/rag_chat_stream")
+async def rag_chat_stream(request: ChatRequest, user: User = Depends(get_current_user)):
+    """Streaming /rag_chat: the answer arrives as server-sent events."""
+    scope = await asyncio.to_thread(content_scope, shard_path(user.id, request.course), shard_key(user.id, request.course))
+
+    qa_chain = await asyncio.to_thread(
+        retriever_service.get_chain, user.id, request.course, nprobe=request.nprobe, ef_search=request.ef_search
+    )
+    if qa_chain is None:
         raise HTTPException(status_code=400, detail="No PDFs indexed yet. Please upload first.")
 
-    embeddings = FastEmbedEmbeddings()
-    vectorstore = FAISS.load_local(VECTOR_DB_PATH, embeddings, allow_dangerous_deserialization=True)
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    use_cache = scope is not None and not (request.nprobe or request.ef_search)
+    query_vector = None
+    if use_cache:
+        query_vector = await asyncio.to_thread(retriever_service.embed_query, request.message)
+        cached = answer_cache.lookup(*scope, query_vector)
+        if cached is not None:
+            return _sse_response("/rag_chat_stream", _single_token(cached), cached=True)
 
-    llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0.2)
+    async def tokens():
+        async with llm_slot(RAG_MODEL):
+            async for token in astream_answer(qa_chain, request.message, query_vector):
+                yield token
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=retriever,
-        return_source_documents=False
-    )
+    def store(answer, timing):
+        if use_cache:
+            answer_cache.store(*scope, query_vector, request.message, answer, timing["total_s"])
+
+    return _sse_response("/rag_chat_stream", tokens(), on_complete=store, cached=False)
+
+@app.get("/llm_cache_stats")
+def api_llm_cache_stats(user: User = Depends(get_current_user)):
+    return llm_cache.summary()
+
+@app.get("/llm_concurrency")
+def api_llm_concurrency(user: User = Depends(get_current_user)):
+    return llm_limiter.summary()
+
+@app.get("/llm_client_stats")
+def api_llm_client_stats(user: User = Depends(get_current_user)):
+    return llm_clients.summary()
+
+@app.get("/auth_stats")
+def api_auth_stats(user: User = Depends(get_current_user)):
+    return token_cache.summary()
+
+@app.get("/coalescing_stats")
+def api_coalescing_stats(user: User = Depends(get_current_user)):
+    return single_flight.summary()
+
+@app.get("/stream_stats")
+def api_stream_stats(user: User = Depends(get_current_user)):
+    return stream_stats.summary()
+
+@app.get("/instructor_sessions")
+def api_instructor_sessions(user: User = Depends(get_current_user)):
+    return {**instructor_sessions.summary(), "context": context_summary()}
 
-    response = qa_chain.invoke({"query": request.message})
-    return {"response": response['result']}
+@app.get("/retriever_stats")
+def api_retriever_stats(user: User = Depends(get_current_user)):
+    return {**retriever_service.stats(), "compactor": compactor.stats, "answer_cache": answer_cache.summary()}
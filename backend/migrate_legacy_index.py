@@ -0,0 +1,35 @@
+# backend/migrate_legacy_index.py
+# One-off move of the pre-sharding global FAISS index (VECTOR_DB_PATH) into one
+# user's shard. The old index was shared by everyone and records no owner, so
+# the operator picks who gets it. Afterwards the old directory is renamed to
+# <VECTOR_DB_PATH>.migrated so the migration cannot run twice.
+# Usage: python migrate_legacy_index.py <user_id> [course]
+import os
+import sys
+import time
+from langchain_community.vectorstores import FAISS
+
+from pdf_extract import file_hash
+from segment_store import append_segment
+from vector_store import VECTOR_DB_PATH, get_embeddings, shard_path
+
+
+def migrate(user_id, course=None):
+    if not os.path.isdir(VECTOR_DB_PATH):
+        print(f"No legacy index at {VECTOR_DB_PATH}; nothing to migrate")
+        return None
+    start = time.perf_counter()
+    store = FAISS.load_local(VECTOR_DB_PATH, get_embeddings(), allow_dangerous_deserialization=True)
+    # The original PDFs are gone; the index file's hash stands in as the source id
+    source = f"legacy:{file_hash(os.path.join(VECTOR_DB_PATH, 'index.faiss'))}"
+    target = shard_path(user_id, course)
+    name = append_segment(target, store, sources=[source])
+    os.rename(VECTOR_DB_PATH, f"{VECTOR_DB_PATH}.migrated")
+    print(f"Migrated {store.index.ntotal} vectors into {target} as {name} in {time.perf_counter() - start:.2f}s")
+    return name
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python migrate_legacy_index.py <user_id> [course]")
+    migrate(int(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else None)
@@ -1,6 +1,7 @@
 # backend/models.py
 from typing import Optional
 from sqlmodel import SQLModel, Field, create_engine, Session, select
+from sqlalchemy import Index
 from datetime import datetime
 
 class User(SQLModel, table=True):
@@ -11,6 +12,9 @@ class User(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Progress(SQLModel, table=True):
+    # One row per learner and topic; writes go through progress_store's upsert
+    __table_args__ = (Index("ix_progress_user_topic", "user_id", "topic", unique=True),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True)
     topic: str
@@ -18,8 +22,92 @@ class Progress(SQLModel, table=True):
     last_updated: datetime = Field(default_factory=datetime.utcnow)
 
 class QuizResult(SQLModel, table=True):
+    __table_args__ = (Index("ix_quizresult_user_topic_created", "user_id", "topic", "created_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True)
     topic: str
     score: float
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class IngestJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(index=True)
+    course: Optional[str] = None
+    path: str
+    status: str = Field(default="queued", index=True)  # queued/running/done/failed
+    stage: str = "queued"  # queued/embedding/saving/done/failed
+    pages_processed: int = 0
+    chunks_embedded: int = 0
+    duplicate: bool = False
+    cache_hit_rate: float = 0.0
+    bytes_saved: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BankQuestion(SQLModel, table=True):
+    __table_args__ = (Index("ix_bankquestion_topic_difficulty", "topic", "difficulty"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str  # normalized, see llm_cache.normalize_topic
+    difficulty: str
+    question: str
+    choices: str  # JSON-encoded list of choices
+    correct_answer: int
+    content_hash: str = Field(index=True, unique=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SeenQuestion(SQLModel, table=True):
+    __table_args__ = (Index("ix_seenquestion_user_question", "user_id", "question_id", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    question_id: int
+    seen_at: datetime = Field(default_factory=datetime.utcnow)
+
+class InstructorSession(SQLModel, table=True):
+    __table_args__ = (Index("ix_instructorsession_user_course", "user_id", "course", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    course: str = ""  # "" when the session is not tied to a course
+    syllabus: str = ""
+    topic: str = ""
+    history: str = "[]"  # JSON-encoded list of conversation turns
+    summary: str = ""  # rolling summary of turns no longer in history
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TopicStats(SQLModel, table=True):
+    # Running aggregates over a learner's QuizResult rows for one topic, updated on every submission
+    __table_args__ = (Index("ix_topicstats_user_topic", "user_id", "topic", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    topic: str
+    attempts: int = 0
+    score_sum: float = 0.0
+    score_sq_sum: float = 0.0
+    best_score: float = 0.0
+    last_score: float = 0.0
+    last_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CohortScoreBin(SQLModel, table=True):
+    # Per-topic score histogram across all learners: one row per non-empty bin, see cohort_stats
+    __table_args__ = (Index("ix_cohortscorebin_topic_bin", "topic", "bin", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str
+    bin: int
+    count: int = 0
+    score_sum: float = 0.0
+
+class IssuedQuiz(SQLModel, table=True):
+    # A quiz as handed to a learner; the answer key stays server-side for grading
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(index=True)
+    topic: str
+    difficulty: str
+    questions: str  # JSON-encoded list of {question, choices, correct_answer}
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    submitted_at: Optional[datetime] = None
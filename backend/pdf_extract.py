@@ -0,0 +1,133 @@
+# backend/pdf_extract.py
+import os
+import json
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+# Extractor backend and parallelism are chosen per deployment
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "pypdf2")  # pypdf2 | pdfminer
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", "./extract_cache")
+
+_executor = None
+_executor_workers = 0
+
+
+# --------------------------------------------------------------------
+# Extractor backends: each returns the text of pages [start, end)
+# --------------------------------------------------------------------
+def _extract_range_pypdf2(file_path, start, end):
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _extract_range_pdfminer(file_path, start, end):
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    texts = []
+    for layout in extract_pages(file_path, page_numbers=range(start, end)):
+        texts.append("".join(el.get_text() for el in layout if isinstance(el, LTTextContainer)))
+    return texts
+
+EXTRACTORS = {
+    "pypdf2": _extract_range_pypdf2,
+    "pdfminer": _extract_range_pdfminer,
+}
+
+def _extract_range(backend, file_path, start, end):
+    return EXTRACTORS[backend](file_path, start, end)
+
+
+# --------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------
+def file_hash(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def page_count(file_path):
+    return len(PdfReader(file_path).pages)
+
+def _cache_path(digest, backend):
+    return os.path.join(EXTRACT_CACHE_DIR, f"{digest}.{backend}.jsonl")
+
+def _get_executor(workers):
+    # One pool per process, rebuilt only if the worker count changes
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        # Spawned, not forked: the parent is multithreaded and a forked child could inherit held locks
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _executor_workers = workers
+    return _executor
+
+def _iter_ranges(n_pages, pages_per_task):
+    for start in range(0, n_pages, pages_per_task):
+        yield start, min(start + pages_per_task, n_pages)
+
+def _iter_extracted(file_path, backend, workers, pages_per_task):
+    n_pages = page_count(file_path)
+    ranges = _iter_ranges(n_pages, pages_per_task)
+
+    if workers <= 1 or n_pages <= pages_per_task:
+        for start, end in ranges:
+            yield from _extract_range(backend, file_path, start, end)
+        return
+
+    # Keep a bounded window of page ranges in flight and yield them in order
+    executor = _get_executor(workers)
+    pending = deque()
+    for start, end in ranges:
+        pending.append(executor.submit(_extract_range, backend, file_path, start, end))
+        if len(pending) >= workers * 2:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+# --------------------------------------------------------------------
+# Public API
+# --------------------------------------------------------------------
+def iter_pages(file_path, backend=None, workers=None, pages_per_task=None, use_cache=True):
+    """
+    Yield the text of every page in order. Page ranges are extracted across a
+    process pool, and results are cached per page under the file's content
+    hash so the same PDF is never parsed twice.
+    """
+    backend = backend or PDF_EXTRACTOR
+    if backend not in EXTRACTORS:
+        raise ValueError(f"Unknown PDF extractor '{backend}'. Choose one of: {', '.join(EXTRACTORS)}")
+    workers = workers or EXTRACT_WORKERS
+    pages_per_task = pages_per_task or EXTRACT_PAGES_PER_TASK
+
+    if not use_cache:
+        yield from _iter_extracted(file_path, backend, workers, pages_per_task)
+        return
+
+    cache_path = _cache_path(file_hash(file_path), backend)
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+        return
+
+    # Write the cache as pages stream through; publish it only once complete
+    os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for text in _iter_extracted(file_path, backend, workers, pages_per_task):
+                f.write(json.dumps(text) + "\n")
+                yield text
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,342 @@
+# backend/progress_store.py
+import os
+import glob
+import json
+import math
+import time
+import threading
+from datetime import datetime
+from sqlalchemy import case
+from sqlmodel import select
+
+from storage import get_session, upsert_insert as _insert
+from models import Progress, QuizResult, TopicStats, CohortScoreBin
+from cohort_stats import ScoreSketch
+
+# Optional write-behind for quiz submissions: accepted immediately, committed in
+# bulk transactions once QUIZ_FLUSH_MAX_BATCH are pending or every QUIZ_FLUSH_INTERVAL_S
+QUIZ_WRITE_BEHIND = os.getenv("QUIZ_WRITE_BEHIND", "0") == "1"
+QUIZ_FLUSH_MAX_BATCH = int(os.getenv("QUIZ_FLUSH_MAX_BATCH", "200"))
+QUIZ_FLUSH_INTERVAL_S = float(os.getenv("QUIZ_FLUSH_INTERVAL_S", "0.5"))
+# At shutdown a failing flush is retried QUIZ_STOP_RETRIES times with doubling
+# backoff; whatever still cannot be committed is spilled to QUIZ_SPILL_DIR and
+# replayed by the next worker to start
+QUIZ_STOP_RETRIES = int(os.getenv("QUIZ_STOP_RETRIES", "3"))
+QUIZ_STOP_BACKOFF_S = float(os.getenv("QUIZ_STOP_BACKOFF_S", "0.5"))
+QUIZ_SPILL_DIR = os.getenv("QUIZ_SPILL_DIR", "./quiz_spill")
+
+
+def _upsert_progress(s, user_id, topic, percent):
+    """Single-statement upsert: create the row or raise completed_percent to at least percent."""
+    stmt = _insert(Progress).values(user_id=user_id, topic=topic, completed_percent=percent, last_updated=datetime.utcnow())
+    excluded = stmt.excluded
+    s.connection().execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "topic"],
+        set_={
+            "completed_percent": case(
+                (excluded.completed_percent > Progress.completed_percent, excluded.completed_percent),
+                else_=Progress.completed_percent,
+            ),
+            "last_updated": excluded.last_updated,
+        },
+    ))
+
+class StatsDelta:
+    """Aggregates of a run of scores for one learner and topic, in the shape TopicStats stores."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.score_sum = 0.0
+        self.score_sq_sum = 0.0
+        self.best_score = None
+        self.last_score = None
+        self.last_attempt_at = None
+
+    def add(self, score, at):
+        self.attempts += 1
+        self.score_sum += score
+        self.score_sq_sum += score * score
+        self.best_score = score if self.best_score is None else max(self.best_score, score)
+        if self.last_attempt_at is None or at >= self.last_attempt_at:
+            self.last_score, self.last_attempt_at = score, at
+        return self
+
+def _upsert_stats(s, user_id, topic, delta):
+    """Fold a StatsDelta into the learner's TopicStats row with one statement."""
+    stmt = _insert(TopicStats).values(
+        user_id=user_id, topic=topic, attempts=delta.attempts, score_sum=delta.score_sum,
+        score_sq_sum=delta.score_sq_sum, best_score=delta.best_score, last_score=delta.last_score,
+        last_attempt_at=delta.last_attempt_at,
+    )
+    excluded = stmt.excluded
+    newer = excluded.last_attempt_at >= TopicStats.last_attempt_at
+    s.connection().execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "topic"],
+        set_={
+            "attempts": TopicStats.attempts + excluded.attempts,
+            "score_sum": TopicStats.score_sum + excluded.score_sum,
+            "score_sq_sum": TopicStats.score_sq_sum + excluded.score_sq_sum,
+            "best_score": case((excluded.best_score > TopicStats.best_score, excluded.best_score), else_=TopicStats.best_score),
+            "last_score": case((newer, excluded.last_score), else_=TopicStats.last_score),
+            "last_attempt_at": case((newer, excluded.last_attempt_at), else_=TopicStats.last_attempt_at),
+        },
+    ))
+
+def _upsert_score_bins(s, topic, sketch):
+    """Add a ScoreSketch's bin counts into the topic's class-wide histogram."""
+    for b, (count, score_sum) in sketch.bins.items():
+        stmt = _insert(CohortScoreBin).values(topic=topic, bin=b, count=count, score_sum=score_sum)
+        excluded = stmt.excluded
+        s.connection().execute(stmt.on_conflict_do_update(
+            index_elements=["topic", "bin"],
+            set_={"count": CohortScoreBin.count + excluded.count, "score_sum": CohortScoreBin.score_sum + excluded.score_sum},
+        ))
+
+def record_quiz_result(user_id: int, topic: str, score: float):
+    """Store a quiz score and fold it into the learner's progress and stats, in one transaction."""
+    at = datetime.utcnow()
+    with get_session() as s:
+        s.add(QuizResult(user_id=user_id, topic=topic, score=score, created_at=at))
+        _upsert_progress(s, user_id, topic, min(100.0, score))
+        _upsert_stats(s, user_id, topic, StatsDelta().add(score, at))
+        _upsert_score_bins(s, topic, ScoreSketch().add(score))
+        s.commit()
+
+def ensure_progress(user_id: int, topic: str):
+    """Start tracking a topic at 0% without touching existing progress."""
+    stmt = _insert(Progress).values(user_id=user_id, topic=topic, completed_percent=0.0, last_updated=datetime.utcnow())
+    with get_session() as s:
+        s.connection().execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "topic"]))
+        s.commit()
+
+
+class QuizResultWriter:
+    """
+    Write-behind buffer for quiz results. submit() only queues; a background
+    thread commits everything pending in one transaction (results inserted,
+    progress upserted once per learner and topic). A failed flush is retried
+    on the next interval. stop() flushes whatever is left, retrying with
+    backoff and spilling to disk what still fails; start() replays spills.
+    Submissions this worker has accepted but not yet committed are visible
+    through pending_for(). That is only this worker's buffer: with several
+    workers, a submission buffered elsewhere becomes visible once that worker
+    flushes, i.e. within QUIZ_FLUSH_INTERVAL_S.
+    With QUIZ_WRITE_BEHIND off, submit() writes synchronously.
+    """
+
+    def __init__(self, enabled=QUIZ_WRITE_BEHIND, max_batch=QUIZ_FLUSH_MAX_BATCH, interval_s=QUIZ_FLUSH_INTERVAL_S,
+                 spill_dir=QUIZ_SPILL_DIR):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.interval_s = interval_s
+        self.spill_dir = spill_dir
+        self._pending = []  # (user_id, topic, score, created_at)
+        self._flushing = []  # batch being committed right now
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = False
+        self._thread = None
+        self.stats = {
+            "submitted": 0, "flushes": 0, "rows_written": 0, "max_batch_seen": 0, "flush_failures": 0,
+            "rows_spilled": 0, "rows_replayed": 0,
+        }
+
+    def start(self):
+        # Results a previous worker could not commit on its way down
+        self.replay_spills()
+        if self.enabled and self._thread is None:
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="quiz-result-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and commit everything still pending, spilling to disk what cannot be."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        delay = QUIZ_STOP_BACKOFF_S
+        for attempt in range(QUIZ_STOP_RETRIES + 1):
+            if self.flush():
+                return
+            if attempt < QUIZ_STOP_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+        self._spill()
+
+    def _spill(self):
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"quiz_results_{os.getpid()}_{time.time_ns()}.jsonl")
+        with open(f"{path}.tmp", "w") as f:
+            for user_id, topic, score, at in batch:
+                f.write(json.dumps([user_id, topic, score, at.isoformat()]) + "\n")
+        os.replace(f"{path}.tmp", path)
+        self.stats["rows_spilled"] += len(batch)
+        print(f"Spilled {len(batch)} uncommitted quiz results to {path}")
+
+    def replay_spills(self):
+        """Commit results spilled by stopped workers. Each file is claimed by rename, so only one worker replays it."""
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "quiz_results_*.jsonl"))):
+            claimed = f"{path}.replaying.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as f:
+                batch = [(u, t, sc, datetime.fromisoformat(at)) for u, t, sc, at in map(json.loads, f)]
+            try:
+                _write_batch(batch)
+            except Exception as e:
+                os.rename(claimed, path)
+                print(f"Replaying {path} failed, will retry on next start: {e}")
+                continue
+            os.remove(claimed)
+            self.stats["rows_replayed"] += len(batch)
+            print(f"Replayed {len(batch)} spilled quiz results from {path}")
+
+    def submit(self, user_id: int, topic: str, score: float):
+        if not self.enabled:
+            record_quiz_result(user_id, topic, score)
+            return
+        with self._cond:
+            self._pending.append((user_id, topic, score, datetime.utcnow()))
+            self.stats["submitted"] += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def pending_for(self, user_id: int):
+        """(topic, score, created_at) of this user's submissions accepted but not yet committed by this worker."""
+        with self._cond:
+            return [(topic, score, at) for uid, topic, score, at in self._flushing + self._pending if uid == user_id]
+
+    def read_with_pending(self, user_id: int, read):
+        """
+        Call read(pending) with this user's uncommitted submissions while no
+        flush can commit, so additive reads never count a submission twice.
+        """
+        with self._flush_lock:
+            return read(self.pending_for(user_id))
+
+    def flush(self):
+        """Commit everything pending; False if the batch failed and was put back."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                self._flushing = batch
+            if not batch:
+                return True
+            try:
+                _write_batch(batch)
+            except Exception as e:
+                with self._cond:
+                    # Keep submission order: the failed batch goes back in front
+                    self._pending = batch + self._pending
+                    self.stats["flush_failures"] += 1
+                print(f"Quiz result flush of {len(batch)} rows failed, will retry: {e}")
+                return False
+            finally:
+                with self._cond:
+                    self._flushing = []
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(batch)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+            return True
+
+    def summary(self):
+        with self._cond:
+            pending = len(self._pending) + len(self._flushing)
+        return {**self.stats, "enabled": self.enabled, "pending": pending,
+                "max_batch": self.max_batch, "interval_s": self.interval_s}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stop and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.interval_s)
+                if self._stop:
+                    return
+            self.flush()
+
+
+def _write_batch(batch):
+    """Insert a batch of results and upsert the affected progress, stats and cohort rows in one transaction."""
+    deltas = {}  # (user_id, topic) -> StatsDelta for the batch
+    sketches = {}  # topic -> ScoreSketch for the batch
+    for user_id, topic, score, at in batch:
+        deltas.setdefault((user_id, topic), StatsDelta()).add(score, at)
+        sketches.setdefault(topic, ScoreSketch()).add(score)
+    with get_session() as s:
+        s.add_all([QuizResult(user_id=u, topic=t, score=sc, created_at=at) for u, t, sc, at in batch])
+        for (user_id, topic), delta in deltas.items():
+            _upsert_progress(s, user_id, topic, min(100.0, delta.best_score))
+            _upsert_stats(s, user_id, topic, delta)
+        for topic, sketch in sketches.items():
+            _upsert_score_bins(s, topic, sketch)
+        s.commit()
+
+
+def merge_pending_progress(user_id, rows, pending):
+    """
+    Overlay uncommitted submissions (from pending_for) on a user's progress
+    rows (as dicts). Taking the max makes it harmless if a submission was
+    already committed, so callers read pending_for() before querying the database.
+    """
+    by_topic = {row["topic"]: row for row in rows}
+    for topic, score, _ in pending:
+        percent = min(100.0, score)
+        row = by_topic.get(topic)
+        if row is None:
+            row = by_topic[topic] = {
+                "id": None, "user_id": user_id, "topic": topic, "completed_percent": percent, "last_updated": datetime.utcnow(),
+            }
+            rows.append(row)
+        elif percent > row["completed_percent"]:
+            row["completed_percent"] = percent
+    return rows
+
+
+def _stats_view(topic, attempts, score_sum, score_sq_sum, best_score, last_score, last_attempt_at):
+    mean = score_sum / attempts
+    variance = max(0.0, score_sq_sum / attempts - mean * mean)
+    return {
+        "topic": topic,
+        "attempts": attempts,
+        "mean_score": round(mean, 2),
+        "stddev": round(math.sqrt(variance), 2),
+        "best_score": best_score,
+        "last_score": last_score,
+        # Positive when the latest attempt beat the learner's average on the topic
+        "trend": round(last_score - mean, 2),
+        "last_attempt_at": last_attempt_at,
+    }
+
+def topic_stats(user_id: int, pending=()):
+    """
+    Per-topic statistics for a learner, read from TopicStats in O(topics).
+    Uncommitted submissions can be folded in; stats are additive, so call
+    it through QuizResultWriter.read_with_pending.
+    """
+    with get_session() as s:
+        rows = s.exec(select(TopicStats).where(TopicStats.user_id == user_id)).all()
+    merged = {
+        r.topic: [r.attempts, r.score_sum, r.score_sq_sum, r.best_score, r.last_score, r.last_attempt_at]
+        for r in rows
+    }
+    for topic, score, at in pending:
+        row = merged.setdefault(topic, [0, 0.0, 0.0, score, score, at])
+        row[0] += 1
+        row[1] += score
+        row[2] += score * score
+        row[3] = max(row[3], score)
+        if at >= row[5]:
+            row[4], row[5] = score, at
+    return [_stats_view(topic, *row) for topic, row in sorted(merged.items())]
+
+
+quiz_writer = QuizResultWriter()
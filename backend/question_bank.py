@@ -0,0 +1,204 @@
+# backend/question_bank.py
+import os
+import json
+import queue
+import asyncio
+import hashlib
+import threading
+from datetime import datetime
+from collections import Counter
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from storage import get_session, upsert_insert
+from models import BankQuestion, SeenQuestion
+from llm_cache import normalize_topic
+
+# Refill a topic/difficulty once fewer than LOW_WATER questions are banked for it
+QUESTION_BANK_LOW_WATER = int(os.getenv("QUESTION_BANK_LOW_WATER", "20"))
+QUESTION_BANK_REFILL_BATCH = int(os.getenv("QUESTION_BANK_REFILL_BATCH", "10"))
+QUESTION_BANK_REFILL_INTERVAL_S = float(os.getenv("QUESTION_BANK_REFILL_INTERVAL_S", "300"))
+# How many of the most requested topics the periodic sweep keeps topped up
+QUESTION_BANK_POPULAR_TOPICS = int(os.getenv("QUESTION_BANK_POPULAR_TOPICS", "20"))
+
+_demand = Counter()  # (topic, difficulty) -> quiz requests seen by this worker
+_demand_lock = threading.Lock()
+_refill_queue = queue.Queue()
+_queued = set()
+_stop = threading.Event()
+_worker = None
+
+
+# --------------------------------------------------------------------
+# Bank storage
+# --------------------------------------------------------------------
+def _question_hash(topic, difficulty, q):
+    text = json.dumps([topic, difficulty, q["question"].strip().lower(), q["choices"]])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _is_valid(q):
+    return (
+        isinstance(q, dict)
+        and isinstance(q.get("question"), str)
+        and isinstance(q.get("choices"), list)
+        and len(q["choices"]) >= 2
+        and isinstance(q.get("correct_answer"), int)
+        and 0 <= q["correct_answer"] < len(q["choices"])
+    )
+
+def add_questions(topic, difficulty, questions):
+    """Store generated questions, skipping malformed ones and exact duplicates. Returns new row ids."""
+    added = []
+    for q in questions:
+        if not _is_valid(q):
+            continue
+        row = BankQuestion(
+            topic=topic,
+            difficulty=difficulty,
+            question=q["question"],
+            choices=json.dumps(q["choices"]),
+            correct_answer=q["correct_answer"],
+            content_hash=_question_hash(topic, difficulty, q),
+        )
+        with get_session() as s:
+            s.add(row)
+            try:
+                s.commit()
+            except IntegrityError:
+                s.rollback()
+                continue
+            added.append(row.id)
+    return added
+
+def bank_size(topic, difficulty):
+    with get_session() as s:
+        return s.exec(
+            select(func.count(BankQuestion.id)).where(BankQuestion.topic == topic, BankQuestion.difficulty == difficulty)
+        ).one()
+
+def _unseen(user_id, topic, difficulty, n):
+    seen = select(SeenQuestion.question_id).where(SeenQuestion.user_id == user_id)
+    with get_session() as s:
+        return s.exec(
+            select(BankQuestion)
+            .where(
+                BankQuestion.topic == topic,
+                BankQuestion.difficulty == difficulty,
+                BankQuestion.id.not_in(seen),
+            )
+            .order_by(func.random())
+            .limit(n)
+        ).all()
+
+def _mark_seen(user_id, rows):
+    if not rows:
+        return
+    # Concurrent quizzes for the same user may draw the same question; the first mark wins
+    now = datetime.utcnow()
+    stmt = upsert_insert(SeenQuestion).values([{"user_id": user_id, "question_id": row.id, "seen_at": now} for row in rows])
+    with get_session() as s:
+        s.connection().execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "question_id"]))
+        s.commit()
+
+def _to_quiz_item(row):
+    return {"question": row.question, "choices": json.loads(row.choices), "correct_answer": row.correct_answer}
+
+
+# --------------------------------------------------------------------
+# Quiz assembly
+# --------------------------------------------------------------------
+def _take(user_id, topic, difficulty, n_questions):
+    with _demand_lock:
+        _demand[(topic, difficulty)] += 1
+    return list(_unseen(user_id, topic, difficulty, n_questions))
+
+def _complete(user_id, topic, difficulty, n_questions, rows, generated):
+    error = None
+    if isinstance(generated, list):
+        add_questions(topic, difficulty, generated)
+        chosen = {row.id for row in rows}
+        extra = [r for r in _unseen(user_id, topic, difficulty, n_questions) if r.id not in chosen]
+        rows += extra[: n_questions - len(rows)]
+    elif generated is not None:
+        error = generated
+
+    if not rows and error is not None:
+        return error
+    _mark_seen(user_id, rows)
+
+    if bank_size(topic, difficulty) < QUESTION_BANK_LOW_WATER:
+        request_refill(topic, difficulty)
+    return [_to_quiz_item(row) for row in rows]
+
+def assemble_quiz(user_id, topic, difficulty, n_questions, generate):
+    """
+    Build a quiz from banked questions this user has not seen yet. Only a
+    shortfall is generated synchronously (via generate(topic, difficulty, n)).
+    Returns a list of questions, or the generator's error dict if nothing
+    could be served.
+    """
+    topic, difficulty = normalize_topic(topic), difficulty.strip().lower()
+    rows = _take(user_id, topic, difficulty, n_questions)
+    generated = None
+    if len(rows) < n_questions:
+        generated = generate(topic, difficulty, n_questions - len(rows))
+    return _complete(user_id, topic, difficulty, n_questions, rows, generated)
+
+async def aassemble_quiz(user_id, topic, difficulty, n_questions, agenerate):
+    """assemble_quiz for async handlers: agenerate is awaited, database work runs in a thread."""
+    topic, difficulty = normalize_topic(topic), difficulty.strip().lower()
+    rows = await asyncio.to_thread(_take, user_id, topic, difficulty, n_questions)
+    generated = None
+    if len(rows) < n_questions:
+        generated = await agenerate(topic, difficulty, n_questions - len(rows))
+    return await asyncio.to_thread(_complete, user_id, topic, difficulty, n_questions, rows, generated)
+
+
+# --------------------------------------------------------------------
+# Background refill
+# --------------------------------------------------------------------
+def request_refill(topic, difficulty):
+    key = (topic, difficulty)
+    with _demand_lock:
+        if key in _queued:
+            return
+        _queued.add(key)
+    _refill_queue.put(key)
+
+def _refill(topic, difficulty, generate):
+    while bank_size(topic, difficulty) < QUESTION_BANK_LOW_WATER and not _stop.is_set():
+        generated = generate(topic, difficulty, QUESTION_BANK_REFILL_BATCH)
+        if not isinstance(generated, list) or not add_questions(topic, difficulty, generated):
+            # LLM error or nothing new came back; try again on a later sweep
+            break
+
+def _run(generate):
+    while not _stop.is_set():
+        try:
+            topic, difficulty = _refill_queue.get(timeout=QUESTION_BANK_REFILL_INTERVAL_S)
+        except queue.Empty:
+            # Periodic sweep: keep the most requested topics topped up
+            with _demand_lock:
+                popular = [key for key, _ in _demand.most_common(QUESTION_BANK_POPULAR_TOPICS)]
+            for key in popular:
+                if bank_size(*key) < QUESTION_BANK_LOW_WATER:
+                    request_refill(*key)
+            continue
+        try:
+            _refill(topic, difficulty, generate)
+        except Exception as e:
+            print(f"Question bank refill for '{topic}' ({difficulty}) failed: {e}")
+        finally:
+            with _demand_lock:
+                _queued.discard((topic, difficulty))
+
+def start_refill_worker(generate):
+    global _worker
+    if _worker is None:
+        _stop.clear()
+        _worker = threading.Thread(target=_run, args=(generate,), name="question-bank-refill", daemon=True)
+        _worker.start()
+
+def stop_refill_worker():
+    _stop.set()
@@ -0,0 +1,61 @@
+# backend/quiz_store.py
+import json
+from datetime import datetime
+from sqlalchemy import update
+
+from storage import get_session
+from models import IssuedQuiz
+
+
+def issue_quiz(user_id: int, topic: str, difficulty: str, questions: list):
+    """
+    Persist a generated quiz for this learner and return (quiz_id, questions)
+    with the correct answers stripped, which is all the client gets to see.
+    Returns (None, []) if no question was usable.
+    """
+    key = [
+        {"question": q["question"], "choices": q["choices"], "correct_answer": q["correct_answer"]}
+        for q in questions
+        # Freshly generated (no_cache) quizzes have not been through the bank's validation
+        if isinstance(q, dict) and {"question", "choices", "correct_answer"} <= q.keys()
+    ]
+    if not key:
+        return None, []
+    row = IssuedQuiz(user_id=user_id, topic=topic, difficulty=difficulty, questions=json.dumps(key))
+    with get_session() as s:
+        s.add(row)
+        s.commit()
+        s.refresh(row)
+    return row.id, [{"question": q["question"], "choices": q["choices"]} for q in key]
+
+def get_quiz(user_id: int, quiz_id: int):
+    """The stored quiz, or None if it does not exist or was issued to someone else."""
+    with get_session() as s:
+        row = s.get(IssuedQuiz, quiz_id)
+    return row if row is not None and row.user_id == user_id else None
+
+def mark_submitted(quiz_id: int) -> bool:
+    """Claim a quiz for grading; False if it was already submitted, so each quiz scores once."""
+    with get_session() as s:
+        claimed = s.connection().execute(
+            update(IssuedQuiz)
+            .where(IssuedQuiz.id == quiz_id, IssuedQuiz.submitted_at.is_(None))
+            .values(submitted_at=datetime.utcnow())
+        ).rowcount
+        s.commit()
+    return claimed == 1
+
+def release_submission(quiz_id: int):
+    """Undo mark_submitted when the result could not be recorded."""
+    with get_session() as s:
+        s.connection().execute(update(IssuedQuiz).where(IssuedQuiz.id == quiz_id).values(submitted_at=None))
+        s.commit()
+
+def grade(quiz: IssuedQuiz, answers: list):
+    """(correct, total) for answer indices checked against the stored key."""
+    key = json.loads(quiz.questions)
+    correct = sum(1 for q, a in zip(key, answers) if a == q["correct_answer"])
+    return correct, len(key)
+
+def question_count(quiz: IssuedQuiz) -> int:
+    return len(json.loads(quiz.questions))
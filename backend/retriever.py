@@ -0,0 +1,238 @@
+# backend/retriever.py
+import os
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from langchain.chains import RetrievalQA
+
+from vector_store import shard_key, shard_path, get_embeddings
+from segment_store import read_manifest, load_segment, load_lexical, SegmentedRetriever
+from index_codecs import INDEX_CODEC, INDEX_MMAP, resident_bytes
+from llm_clients import get_llm
+
+# Upper bound on the estimated memory of index shards kept resident per process
+RETRIEVER_MAX_BYTES = int(os.getenv("RETRIEVER_MAX_BYTES", str(512 * 1024 * 1024)))
+RAG_MODEL = "llama-3.1-8b-instant"
+
+
+class _Shard:
+    def __init__(self, segments, lexical, qa_chain, version, size_bytes, load_s):
+        self.segments = segments  # segment name -> loaded FAISS store
+        self.lexical = lexical  # segment name -> LexicalSegment (None for older segments)
+        self.qa_chain = qa_chain
+        self.version = version
+        self.size_bytes = size_bytes
+        self.load_s = load_s
+
+
+class RetrieverService:
+    """
+    Long-lived RAG state for the API process. The embedding model and LLM are
+    built once; each user's (or user+course) index shard is loaded lazily on
+    first use and kept in an LRU bounded by RETRIEVER_MAX_BYTES. When a shard's
+    manifest generation changes only newly published segments are loaded;
+    segments are immutable, so already-resident ones are reused.
+    Shards load outside the map lock, one load per shard and version, so a
+    cold load for one learner never blocks retrieval for the others.
+    """
+
+    def __init__(self, k: int = 3, max_bytes: int = RETRIEVER_MAX_BYTES):
+        self.k = k
+        self.max_bytes = max_bytes
+        self.embeddings = None
+        self.llm = None
+        self._shards = OrderedDict()  # shard key -> _Shard, least recently used first
+        self._loading = {}  # shard key -> (version, Future) of the load in progress
+        self._lock = threading.Lock()  # guards _shards, _loading and timings only
+        self._models_lock = threading.Lock()
+        self.timings = {
+            "embeddings_load_s": None,
+            "last_index_load_s": None,
+            "last_reload_at": None,
+            "reloads": 0,
+            "evictions": 0,
+        }
+
+    def warm_up(self):
+        """Load the embedding model and LLM client ahead of the first request."""
+        self._load_models()
+
+    def get_chain(self, user_id, course=None, nprobe=None, ef_search=None):
+        """
+        Return the QA chain over the caller's shard, or None if it has nothing
+        indexed. nprobe / ef_search override the ANN search depth for this call.
+        """
+        key = shard_key(user_id, course)
+        path = shard_path(user_id, course)
+        manifest = read_manifest(path)
+        if not manifest["segments"]:
+            return None
+
+        shard = self._get_shard(key, path, manifest)
+
+        if nprobe or ef_search:
+            retriever = SegmentedRetriever(
+                embeddings=self.embeddings,
+                segments=list(shard.segments.values()),
+                lexical=list(shard.lexical.values()),
+                k=self.k,
+                nprobe=nprobe,
+                ef_search=ef_search,
+            )
+            return self._build_chain(retriever)
+        return shard.qa_chain
+
+    def embed_query(self, text):
+        self._load_models()
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident_shards": len(self._shards),
+                "resident_bytes": sum(s.size_bytes for s in self._shards.values()),
+                "max_bytes": self.max_bytes,
+                "index_codec": INDEX_CODEC,
+                "index_mmap": INDEX_MMAP,
+                "shards": {
+                    key: {"version": s.version, "segments": len(s.segments), "size_bytes": s.size_bytes, "load_s": s.load_s}
+                    for key, s in self._shards.items()
+                },
+                **self.timings,
+            }
+
+    # ----------------------------------------------------------------
+    # Internal helpers
+    # ----------------------------------------------------------------
+    def _load_models(self):
+        if self.embeddings is not None and self.llm is not None:
+            return
+        with self._models_lock:
+            if self.embeddings is None:
+                start = time.perf_counter()
+                self.embeddings = get_embeddings()
+                self.timings["embeddings_load_s"] = round(time.perf_counter() - start, 4)
+                print(f"Retriever: embedding model loaded in {self.timings['embeddings_load_s']}s")
+            if self.llm is None:
+                self.llm = get_llm(RAG_MODEL, 0.2)
+
+    def _get_shard(self, key, path, manifest):
+        """The resident shard at the manifest's version, loading it (once) if needed."""
+        version = manifest["generation"]
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None and shard.version == version:
+                self._shards.move_to_end(key)
+                return shard
+            loading = self._loading.get(key)
+            if loading is not None and loading[0] == version:
+                future, owner = loading[1], False
+            else:
+                future, owner = Future(), True
+                self._loading[key] = (version, future)
+        if not owner:
+            # Someone else is already loading this shard version
+            return future.result()
+
+        try:
+            self._load_models()
+            # Disk reads happen here, outside the map lock
+            loaded = self._load_shard(path, manifest, previous=shard)
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(key, (None, None))[1] is future:
+                    del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            current = self._shards.get(key)
+            # A concurrent load of a newer version may have finished first
+            if current is None or current.version < loaded.version:
+                self._shards[key] = loaded
+                current = loaded
+            self._shards.move_to_end(key)
+            self._evict(keep=key)
+            if self._loading.get(key, (None, None))[1] is future:
+                del self._loading[key]
+            self.timings["last_index_load_s"] = loaded.load_s
+            self.timings["last_reload_at"] = time.time()
+            self.timings["reloads"] += 1
+        print(f"Retriever: shard {key} (version {version}) loaded in {loaded.load_s}s")
+        future.set_result(current)
+        return current
+
+    def _load_shard(self, path, manifest, previous=None):
+        start = time.perf_counter()
+        resident = previous.segments if previous else {}
+        resident_lexical = previous.lexical if previous else {}
+        segments = {}
+        lexical = {}
+        for name in manifest["segments"]:
+            if name in resident:
+                segments[name] = resident[name]
+                lexical[name] = resident_lexical[name]
+            else:
+                segments[name] = load_segment(path, name, self.embeddings)
+                lexical[name] = load_lexical(path, name)
+        retriever = SegmentedRetriever(
+            embeddings=self.embeddings,
+            segments=list(segments.values()),
+            lexical=list(lexical.values()),
+            k=self.k,
+        )
+        qa_chain = self._build_chain(retriever)
+        size_bytes = sum(_estimate_bytes(segment) for segment in segments.values())
+        return _Shard(segments, lexical, qa_chain, manifest["generation"], size_bytes, round(time.perf_counter() - start, 4))
+
+    def _build_chain(self, retriever):
+        return RetrievalQA.from_chain_type(
+            llm=self.llm,
+            retriever=retriever,
+            return_source_documents=False
+        )
+
+    def _evict(self, keep):
+        # Caller holds self._lock
+        total = sum(s.size_bytes for s in self._shards.values())
+        for key in list(self._shards):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._shards.pop(key).size_bytes
+            self.timings["evictions"] += 1
+
+
+def _estimate_bytes(vectorstore):
+    # encoded vectors (zero when memory-mapped) plus the stored chunk text
+    text_bytes = sum(len(doc.page_content) for doc in vectorstore.docstore._dict.values())
+    return resident_bytes(vectorstore.index) + text_bytes
+
+
+def retrieve(qa_chain, query, query_vector=None):
+    """The chain's documents for query, reusing query_vector when the caller already embedded it."""
+    if query_vector is None:
+        return qa_chain.retriever.invoke(query)
+    return qa_chain.retriever.search(query, query_vector)
+
+async def aanswer(qa_chain, query, query_vector=None):
+    """RetrievalQA's answer to query: retrieval in a thread, then the "stuff" chain."""
+    docs = await asyncio.to_thread(retrieve, qa_chain, query, query_vector)
+    return await qa_chain.combine_documents_chain.arun(input_documents=docs, question=query)
+
+async def astream_answer(qa_chain, query, query_vector=None):
+    """
+    Stream a RetrievalQA answer token by token. Retrieval runs in a thread;
+    the "stuff" prompt is then filled exactly as the chain would and the LLM
+    is streamed directly, since RetrievalQA only returns whole completions.
+    """
+    docs = await asyncio.to_thread(retrieve, qa_chain, query, query_vector)
+    stuff = qa_chain.combine_documents_chain
+    inputs = stuff._get_inputs(docs, question=query)
+    messages = stuff.llm_chain.prompt.format_prompt(**inputs).to_messages()
+    async for chunk in stuff.llm_chain.llm.astream(messages):
+        if chunk.content:
+            yield chunk.content
@@ -0,0 +1,453 @@
+# backend/segment_store.py
+import os
+import json
+import time
+import uuid
+import hashlib
+import pickle
+import shutil
+import threading
+from collections import defaultdict
+from typing import Any, List, Optional
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+
+from index_codecs import (
+    ANN_THRESHOLD, ANN_RETRAIN_GROWTH,
+    encode_index, read_index, index_vectors, index_kind, search_params,
+)
+from embedding_cache import embedding_cache
+from lexical_index import LexicalSegment, bm25_search
+
+# Shard layout:
+#   <shard>/MANIFEST.json          live segment list, per-segment info, generation counter
+#   <shard>/segments/<name>/       immutable segment: FAISS (index.faiss + index.pkl)
+#                                  plus BM25 postings (lexical.json.gz)
+MANIFEST_FILE = "MANIFEST.json"
+LOCK_FILE = "MANIFEST.lock"
+SEGMENTS_DIR = "segments"
+
+COMPACT_MAX_SEGMENTS = int(os.getenv("COMPACT_MAX_SEGMENTS", "8"))
+COMPACT_SMALL_BYTES = int(os.getenv("COMPACT_SMALL_BYTES", str(32 * 1024 * 1024)))
+COMPACT_INTERVAL_S = float(os.getenv("COMPACT_INTERVAL_S", "60"))
+SEGMENT_GC_GRACE_S = float(os.getenv("SEGMENT_GC_GRACE_S", "300"))
+# Staged segments never published (their ingestion crashed) are removed after this long
+SEGMENT_ORPHAN_S = float(os.getenv("SEGMENT_ORPHAN_S", str(24 * 3600)))
+LOCK_STALE_S = 60
+
+# Retrieval: "hybrid" fuses BM25 with vector search, "dense" is vectors only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+FUSION = os.getenv("FUSION", "rrf")  # rrf | weighted
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "0.5"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Each ranker contributes k * FUSION_DEPTH candidates before fusion
+FUSION_DEPTH = int(os.getenv("FUSION_DEPTH", "4"))
+
+
+class ManifestLock:
+    """Cross-process lock around manifest read-modify-write, using an O_EXCL lock file."""
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.path = os.path.join(shard_path, LOCK_FILE)
+
+    def __enter__(self):
+        os.makedirs(self.shard_path, exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    # A holder that died mid-update must not block the shard forever
+                    if time.time() - os.path.getmtime(self.path) > LOCK_STALE_S:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# --------------------------------------------------------------------
+# Manifest
+# --------------------------------------------------------------------
+def read_manifest(shard_path):
+    path = os.path.join(shard_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"generation": 0, "segments": [], "info": {}, "garbage": []}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_manifest(shard_path, manifest, bump=True):
+    # Caller holds ManifestLock. Readers always see a complete manifest thanks to os.replace.
+    if bump:
+        manifest["generation"] += 1
+    manifest["updated_at"] = time.time()
+    path = os.path.join(shard_path, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def index_version(shard_path):
+    """Manifest generation of a shard, or None if it has no searchable segments."""
+    manifest = read_manifest(shard_path)
+    return manifest["generation"] if manifest["segments"] else None
+
+def content_scope(shard_path, shard_key):
+    """
+    (key, version) identifying what a shard can answer from, or None if it is empty.
+    Shards built from the same source documents share a key, whoever uploaded
+    them, and compaction does not change it. Shards with segments from before
+    sources were recorded fall back to (shard_key, generation).
+    """
+    manifest = read_manifest(shard_path)
+    if not manifest["segments"]:
+        return None
+    info = manifest.get("info", {})
+    sources = [info.get(name, {}).get("sources") for name in manifest["segments"]]
+    if not all(sources):
+        return shard_key, manifest["generation"]
+    digest = hashlib.sha256(json.dumps(sorted({h for s in sources for h in s})).encode()).hexdigest()
+    return f"content:{digest}", 0
+
+
+# --------------------------------------------------------------------
+# Segments
+# --------------------------------------------------------------------
+def segment_path(shard_path, name):
+    return os.path.join(shard_path, SEGMENTS_DIR, name)
+
+def segment_bytes(shard_path, name):
+    path = segment_path(shard_path, name)
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def _new_segment_name():
+    return f"seg_{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+
+def stage_segment(shard_path, doc_store, sources=()):
+    """
+    Write doc_store as a new immutable segment without publishing it; readers
+    only see segments listed in the manifest. Returns (name, info) for
+    publish_segments. sources are content hashes of the documents in it, see
+    content_scope.
+    """
+    name = _new_segment_name()
+    doc_store.index = encode_index(doc_store.index)
+    doc_store.save_local(segment_path(shard_path, name))
+    _build_lexical(doc_store).save(segment_path(shard_path, name))
+    return name, _segment_info(doc_store.index, sources)
+
+def publish_segments(shard_path, staged):
+    """Make staged segments searchable together, in one manifest update."""
+    with ManifestLock(shard_path):
+        manifest = read_manifest(shard_path)
+        info = manifest.setdefault("info", {})
+        for name, segment_info in staged:
+            manifest["segments"].append(name)
+            info[name] = segment_info
+        _write_manifest(shard_path, manifest)
+
+def discard_segments(shard_path, names):
+    """Delete staged segments that will never be published."""
+    for name in names:
+        shutil.rmtree(segment_path(shard_path, name), ignore_errors=True)
+
+def append_segment(shard_path, doc_store, sources=()):
+    """
+    Write doc_store as a new immutable segment and publish it in the manifest.
+    Cost is proportional to doc_store only; existing segments are untouched.
+    """
+    staged = stage_segment(shard_path, doc_store, sources)
+    publish_segments(shard_path, [staged])
+    return staged[0]
+
+def _build_lexical(store):
+    texts = [
+        store.docstore.search(store.index_to_docstore_id[i]).page_content
+        for i in range(store.index.ntotal)
+    ]
+    return LexicalSegment.build(texts)
+
+def _segment_info(index, sources=()):
+    return {"vectors": index.ntotal, "kind": index_kind(index), "sources": sorted(set(sources))}
+
+def load_segment(shard_path, name, embeddings, mmap=None):
+    # Same on-disk format as FAISS.save_local/load_local, but the index is read
+    # through index_codecs so it can be memory-mapped
+    path = segment_path(shard_path, name)
+    index = read_index(os.path.join(path, "index.faiss"), mmap=mmap)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def load_lexical(shard_path, name):
+    return LexicalSegment.load(segment_path(shard_path, name))
+
+def segment_contents(segment, embeddings):
+    """(ids, documents, vectors) of a segment in index order.
+    Original vectors come from the embedding cache when available, since
+    quantized segments can only reconstruct approximations."""
+    ids = [segment.index_to_docstore_id[i] for i in range(segment.index.ntotal)]
+    docs = [segment.docstore.search(doc_id) for doc_id in ids]
+    vectors = index_vectors(segment.index)
+    cached = embedding_cache.get_vectors(embeddings, [doc.page_content for doc in docs])
+    for i, vec in enumerate(cached):
+        if vec is not None:
+            vectors[i] = vec
+    return ids, docs, vectors
+
+def search_segment(segment, query_vector, k, nprobe=None, ef_search=None):
+    """Top-k (docstore id, L2 distance) pairs from one segment."""
+    x = np.array([query_vector], dtype="float32")
+    params = search_params(segment.index, nprobe=nprobe, ef_search=ef_search)
+    if params is None:
+        distances, ids = segment.index.search(x, k)
+    else:
+        distances, ids = segment.index.search(x, k, params=params)
+    return [
+        (segment.index_to_docstore_id[i], float(distance))
+        for distance, i in zip(distances[0], ids[0])
+        if i != -1
+    ]
+
+def search_segments(segments, query_vector, k, nprobe=None, ef_search=None):
+    """Fan a query out over every segment and merge the per-segment top-k by L2 distance.
+    Returns (docstore id, document, distance) triples, best first."""
+    hits = []
+    for segment in segments:
+        for doc_id, distance in search_segment(segment, query_vector, k, nprobe=nprobe, ef_search=ef_search):
+            hits.append((doc_id, segment.docstore.search(doc_id), distance))
+    hits.sort(key=lambda hit: hit[2])
+    return hits[:k]
+
+def lexical_search(segments, lexical, query, k):
+    """BM25 (docstore id, document, score) triples over the segments' lexical indexes, best first."""
+    hits = []
+    for i, pos, score in bm25_search(lexical, query, k):
+        doc_id = segments[i].index_to_docstore_id[pos]
+        hits.append((doc_id, segments[i].docstore.search(doc_id), score))
+    return hits
+
+def fuse(dense_hits, lexical_hits, k, fusion=FUSION, lexical_weight=LEXICAL_WEIGHT):
+    """Combine dense (distance) and lexical (BM25) rankings into one top-k document list."""
+    docs = {}
+    scores = defaultdict(float)
+    if fusion == "rrf":
+        # Reciprocal rank fusion: only ranks matter, so the score scales need not agree
+        for weight, hits in ((1 - lexical_weight, dense_hits), (lexical_weight, lexical_hits)):
+            for rank, (doc_id, doc, _) in enumerate(hits):
+                docs[doc_id] = doc
+                scores[doc_id] += weight / (RRF_K + rank + 1)
+    elif fusion == "weighted":
+        # Min-max normalise each list (distances inverted) and take a weighted sum
+        for weight, hits, higher_is_better in (
+            (1 - lexical_weight, dense_hits, False),
+            (lexical_weight, lexical_hits, True),
+        ):
+            if not hits:
+                continue
+            values = [value for _, _, value in hits]
+            low, high = min(values), max(values)
+            for doc_id, doc, value in hits:
+                norm = (value - low) / (high - low) if high > low else 1.0
+                docs[doc_id] = doc
+                scores[doc_id] += weight * (norm if higher_is_better else 1 - norm)
+    else:
+        raise ValueError(f"Unknown fusion method '{fusion}'. Choose 'rrf' or 'weighted'.")
+
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[doc_id] for doc_id in best]
+
+
+class SegmentedRetriever(BaseRetriever):
+    """LangChain retriever over all live segments of one shard, dense or hybrid."""
+
+    embeddings: Any
+    segments: List[Any]
+    lexical: List[Any] = []  # LexicalSegment (or None) per segment, same order
+    k: int = 3
+    nprobe: Optional[int] = None  # IVF lists probed; None uses the index default
+    ef_search: Optional[int] = None  # HNSW candidate list size; None uses the index default
+    mode: str = RETRIEVAL_MODE
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.search(query, self.embeddings.embed_query(query))
+
+    def search(self, query: str, query_vector) -> List[Document]:
+        """Retrieve with a query vector the caller already has."""
+        if self.mode != "hybrid" or not any(self.lexical):
+            hits = search_segments(self.segments, query_vector, self.k, nprobe=self.nprobe, ef_search=self.ef_search)
+            return [doc for _, doc, _ in hits]
+
+        depth = self.k * FUSION_DEPTH
+        dense_hits = search_segments(self.segments, query_vector, depth, nprobe=self.nprobe, ef_search=self.ef_search)
+        lexical_hits = lexical_search(self.segments, self.lexical, query, depth)
+        return fuse(dense_hits, lexical_hits, self.k)
+
+
+# --------------------------------------------------------------------
+# Compaction
+# --------------------------------------------------------------------
+def needs_compaction(shard_path, manifest):
+    segments = manifest["segments"]
+    if len(segments) < 2:
+        return False
+    if len(segments) > COMPACT_MAX_SEGMENTS:
+        return True
+
+    # Upgrade to an ANN index once the shard crosses the threshold, and retrain
+    # an existing one after the corpus has grown well past what it was trained on
+    info = manifest.get("info", {})
+    if all(name in info for name in segments):
+        total = sum(info[name]["vectors"] for name in segments)
+        largest = max(segments, key=lambda name: info[name]["vectors"])
+        if info[largest]["kind"] == "flat" and total >= ANN_THRESHOLD:
+            return True
+        if info[largest]["kind"] != "flat" and total >= ANN_RETRAIN_GROWTH * info[largest]["vectors"]:
+            return True
+
+    # Everything but the largest segment counts as "small" data waiting to be merged
+    sizes = sorted(segment_bytes(shard_path, name) for name in segments)
+    return sum(sizes[:-1]) >= COMPACT_SMALL_BYTES
+
+def compact_shard(shard_path, embeddings, force=False):
+    """Merge the shard's current segments into one. Returns stats, or None if nothing was done."""
+    collect_garbage(shard_path)
+    manifest = read_manifest(shard_path)
+    if not (force and len(manifest["segments"]) > 1) and not needs_compaction(shard_path, manifest):
+        return None
+
+    start = time.perf_counter()
+    names = list(manifest["segments"])
+    all_ids, all_docs, all_vectors = [], [], []
+    for name in names:
+        ids, docs, vectors = segment_contents(load_segment(shard_path, name, embeddings, mmap=False), embeddings)
+        all_ids.extend(ids)
+        all_docs.extend(docs)
+        all_vectors.append(vectors)
+    vectors = np.vstack(all_vectors).astype("float32")
+
+    # Rebuild from original vectors so lossy codecs are re-trained on the whole shard
+    merged = FAISS.from_embeddings(
+        [(doc.page_content, vec) for doc, vec in zip(all_docs, vectors.tolist())],
+        embeddings,
+        metadatas=[doc.metadata for doc in all_docs],
+        ids=all_ids,
+    )
+    merged.index = encode_index(merged.index, vectors=vectors)
+    new_name = _new_segment_name()
+    merged.save_local(segment_path(shard_path, new_name))
+    LexicalSegment.build([doc.page_content for doc in all_docs]).save(segment_path(shard_path, new_name))
+
+    with ManifestLock(shard_path):
+        manifest = read_manifest(shard_path)
+        if not all(name in manifest["segments"] for name in names):
+            # Another worker compacted these segments first; publishing ours
+            # as well would store every vector in the shard twice
+            shutil.rmtree(segment_path(shard_path, new_name), ignore_errors=True)
+            print(f"Compaction of {shard_path} superseded by another worker; discarded {new_name}")
+            return None
+        # Keep any segments appended while we were merging
+        appended = [name for name in manifest["segments"] if name not in names]
+        manifest["segments"] = [new_name] + appended
+        info = manifest.setdefault("info", {})
+        merged_sources = [info.get(name, {}).get("sources") for name in names]
+        for name in names:
+            info.pop(name, None)
+        info[new_name] = _segment_info(merged.index)
+        if all(merged_sources):
+            info[new_name]["sources"] = sorted({h for s in merged_sources for h in s})
+        # Old segments stay on disk for a grace period in case a reader is still loading them
+        manifest["garbage"] = manifest.get("garbage", []) + [{"name": n, "at": time.time()} for n in names]
+        _write_manifest(shard_path, manifest)
+
+    stats = {
+        "shard": shard_path,
+        "merged_segments": len(names),
+        "vectors": merged.index.ntotal,
+        "kind": index_kind(merged.index),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    print(f"Compacted {shard_path}: {len(names)} segments -> 1 ({stats['vectors']} vectors) in {stats['seconds']}s")
+    return stats
+
+def collect_garbage(shard_path):
+    now = time.time()
+    with ManifestLock(shard_path):
+        manifest = read_manifest(shard_path)
+        garbage = manifest.get("garbage", [])
+        due = [g for g in garbage if now - g["at"] >= SEGMENT_GC_GRACE_S]
+        if due:
+            manifest["garbage"] = [g for g in garbage if g not in due]
+            _write_manifest(shard_path, manifest, bump=False)
+        known = set(manifest["segments"]) | {g["name"] for g in garbage}
+    names = [g["name"] for g in due] + _orphaned_segments(shard_path, known, now)
+    discard_segments(shard_path, names)
+    return len(names)
+
+def _orphaned_segments(shard_path, known, now):
+    # Staged by an ingestion that died before publishing
+    try:
+        entries = list(os.scandir(os.path.join(shard_path, SEGMENTS_DIR)))
+    except FileNotFoundError:
+        return []
+    return [
+        e.name for e in entries
+        if e.is_dir() and e.name not in known and now - e.stat().st_mtime >= SEGMENT_ORPHAN_S
+    ]
+
+def iter_shards(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        if MANIFEST_FILE in filenames:
+            yield dirpath
+        if SEGMENTS_DIR in dirnames:
+            dirnames.remove(SEGMENTS_DIR)
+
+
+class Compactor:
+    """Background thread that periodically compacts every shard under root."""
+
+    def __init__(self, root, get_embeddings, interval_s: float = COMPACT_INTERVAL_S):
+        self.root = root
+        self.get_embeddings = get_embeddings
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"runs": 0, "compactions": 0, "last_run_s": None, "last_error": None}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="segment-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s)
+
+    def run_once(self):
+        start = time.perf_counter()
+        for shard_path in iter_shards(self.root):
+            try:
+                if compact_shard(shard_path, self.get_embeddings()):
+                    self.stats["compactions"] += 1
+            except Exception as e:
+                self.stats["last_error"] = f"{shard_path}: {e}"
+                print(f"Compaction of {shard_path} failed: {e}")
+        self.stats["runs"] += 1
+        self.stats["last_run_s"] = round(time.perf_counter() - start, 4)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.run_once()
@@ -0,0 +1,41 @@
+# backend/single_flight.py
+import asyncio
+from collections import Counter
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight async calls within a worker: the first caller
+    for a key starts the upstream call, later callers with the same key await
+    the same result instead of issuing their own. The call runs as its own task,
+    so a caller that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+        self.calls = Counter()  # kind -> upstream calls made
+        self.coalesced = Counter()  # kind -> callers served by someone else's call
+
+    async def do(self, kind, key, fn):
+        """Return await fn(), sharing one call among concurrent callers with the same (kind, key)."""
+        full_key = (kind, key)
+        task = self._inflight.get(full_key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[full_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(full_key, None))
+            self.calls[kind] += 1
+        else:
+            self.coalesced[kind] += 1
+        return await asyncio.shield(task)
+
+    def summary(self):
+        kinds = set(self.calls) | set(self.coalesced)
+        return {
+            "in_flight": len(self._inflight),
+            "calls_saved": sum(self.coalesced.values()),
+            "by_kind": {kind: {"upstream_calls": self.calls[kind], "coalesced": self.coalesced[kind]} for kind in sorted(kinds)},
+        }
+
+
+single_flight = SingleFlight()
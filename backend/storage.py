@@ -1,23 +1,63 @@
 # backend/storage.py
 import os
+import uuid
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event, text
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./edu.db")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+# SQLite tuning: WAL lets readers run alongside the writer, NORMAL sync is
+# durable across app crashes in WAL mode, and writers wait for the lock
+# instead of failing with "database is locked"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+IS_SQLITE = "sqlite" in DATABASE_URL
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if IS_SQLITE else {})
+
+# Both dialects support INSERT ... ON CONFLICT, used for single-statement upserts on unique indexes
+upsert_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
 
 def init_db():
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     SQLModel.metadata.create_all(engine)
+    _migrate()
+
+def _migrate():
+    """Bring databases created by older versions up to the current indexes."""
+    with engine.begin() as conn:
+        if "progress" in SQLModel.metadata.tables:
+            # Older versions could write duplicate (user_id, topic) rows; keep the best one
+            conn.execute(text(
+                "DELETE FROM progress WHERE id NOT IN ("
+                " SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+                "  PARTITION BY user_id, topic ORDER BY completed_percent DESC, id) AS rn FROM progress) ranked"
+                " WHERE rn = 1)"
+            ))
+        # create_all only builds indexes for tables it creates
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def get_session():
     return Session(engine)
 
 def save_uploaded_file(file_obj, filename):
-    path = os.path.join(UPLOAD_DIR, filename)
+    # Every upload gets its own file: a queued IngestJob must still find its
+    # PDF even if someone uploads another file with the same name meanwhile
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
     with open(path, "wb") as f:
         f.write(file_obj.read())
     return path
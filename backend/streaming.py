@@ -0,0 +1,77 @@
+# backend/streaming.py
+import json
+import time
+import threading
+from collections import deque
+
+# Recent streams kept for the latency percentiles in /stream_stats
+STREAM_STATS_WINDOW = 1000
+
+
+def sse_event(data, event=None):
+    """Format one server-sent event; data is JSON-encoded."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+
+class StreamTimer:
+    """Times one streamed response: time to first token and total time."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ttft_s = None
+        self.tokens = 0
+
+    def token(self):
+        if self.ttft_s is None:
+            self.ttft_s = time.perf_counter() - self.start
+        self.tokens += 1
+
+    def finish(self):
+        total_s = time.perf_counter() - self.start
+        return {
+            "ttft_s": round(self.ttft_s if self.ttft_s is not None else total_s, 4),
+            "total_s": round(total_s, 4),
+            "tokens": self.tokens,
+        }
+
+
+class StreamStats:
+    """Rolling time-to-first-token / total-time percentiles per streaming endpoint."""
+
+    def __init__(self, window=STREAM_STATS_WINDOW):
+        self._ttft = {}  # endpoint -> deque of seconds
+        self._total = {}
+        self._counts = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, timing):
+        with self._lock:
+            self._ttft.setdefault(endpoint, deque(maxlen=self._window)).append(timing["ttft_s"])
+            self._total.setdefault(endpoint, deque(maxlen=self._window)).append(timing["total_s"])
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+        print(f"{endpoint}: first token {timing['ttft_s']}s, total {timing['total_s']}s, {timing['tokens']} tokens")
+
+    def summary(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    "streams": self._counts[endpoint],
+                    "ttft_p50_s": _percentile(self._ttft[endpoint], 0.5),
+                    "ttft_p95_s": _percentile(self._ttft[endpoint], 0.95),
+                    "total_p50_s": _percentile(self._total[endpoint], 0.5),
+                    "total_p95_s": _percentile(self._total[endpoint], 0.95),
+                }
+                for endpoint in self._counts
+            }
+
+
+stream_stats = StreamStats()
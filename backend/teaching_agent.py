@@ -5,14 +5,22 @@ from dotenv import load_dotenv
 # CORRECTED IMPORTS: LLMChain and PromptTemplate have moved to new locations
 from langchain.chains import LLMChain
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
 from langchain.llms.base import BaseLLM
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from llm_limits import llm_slot
+from llm_clients import get_llm
+from conversation_context import (
+    build_context, record_prompt, record_summary, turns_to_summarize, summary_prompt,
+    truncate_tokens, CONTEXT_SUMMARY_TOKENS,
+)
 
 # Load env
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
+INSTRUCTOR_MODEL = "llama-3.1-8b-instant"
+
 
 class InstructorConversationChain(LLMChain):
     @classmethod
@@ -36,12 +44,16 @@ class TeachingGPT(BaseModel):
     syllabus: str = ""
     conversation_topic: str = ""
     conversation_history: List[str] = []
+    # Rolling summary of the turns that have been dropped from conversation_history
+    summary: str = ""
     teaching_conversation_utterance_chain: InstructorConversationChain = Field(...)
+    _summarizing: bool = PrivateAttr(default=False)
 
     def seed_agent(self, syllabus, task):
         self.syllabus = syllabus
         self.conversation_topic = task
         self.conversation_history = []
+        self.summary = ""
 
     def human_step(self, human_input):
         human_input = human_input + "<END_OF_TURN>"
@@ -50,16 +62,82 @@ class TeachingGPT(BaseModel):
     def instructor_step(self):
         return self._callinstructor(inputs={})
 
+    async def ainstructor_step(self):
+        return await self._acallinstructor(inputs={})
+
+    def _prompt_inputs(self) -> Dict[str, Any]:
+        # Bounded context: capped syllabus, rolling summary, recent turns within budget
+        syllabus, conversation = build_context(self.syllabus, self.summary, self.conversation_history)
+        record_prompt(syllabus, conversation)
+        return dict(syllabus=syllabus, topic=self.conversation_topic, conversation_history=conversation)
+
     def _callinstructor(self, inputs: Dict[str, Any]) -> None:
-        ai_message = self.teaching_conversation_utterance_chain.run(
-            syllabus=self.syllabus,
-            topic=self.conversation_topic,
-            conversation_history="\n".join(self.conversation_history),
-        )
+        ai_message = self.teaching_conversation_utterance_chain.run(**self._prompt_inputs())
         self.conversation_history.append(ai_message)
         print("Instructor: ", ai_message.rstrip("<END_OF_TURN>"))
         return ai_message
 
+    async def _acallinstructor(self, inputs: Dict[str, Any]) -> str:
+        async with llm_slot(INSTRUCTOR_MODEL):
+            ai_message = await self.teaching_conversation_utterance_chain.arun(**self._prompt_inputs())
+        self.conversation_history.append(ai_message)
+        return ai_message
+
+    async def astream_instructor(self):
+        """Yield the instructor's reply token by token; it joins the history once complete."""
+        chain = self.teaching_conversation_utterance_chain
+        prompt = chain.prompt.format(**self._prompt_inputs())
+        parts = []
+        async with llm_slot(INSTRUCTOR_MODEL):
+            async for chunk in chain.llm.astream(prompt):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        self.conversation_history.append("".join(parts))
+
+    def needs_summary(self) -> bool:
+        return not self._summarizing and turns_to_summarize(self.conversation_history) > 0
+
+    def summarize_history(self) -> bool:
+        """Fold turns that no longer fit the verbatim window into the rolling summary."""
+        n = turns_to_summarize(self.conversation_history)
+        if self._summarizing or not n:
+            return False
+        self._summarizing = True
+        try:
+            resp = summary_llm.invoke(summary_prompt(self.summary, self.conversation_history[:n]))
+            self._fold(n, resp.content)
+        except Exception as e:
+            record_summary(failed=True)
+            print(f"Conversation summary failed: {e}")
+            return False
+        finally:
+            self._summarizing = False
+        return True
+
+    async def asummarize_history(self) -> bool:
+        n = turns_to_summarize(self.conversation_history)
+        if self._summarizing or not n:
+            return False
+        self._summarizing = True
+        try:
+            async with llm_slot(INSTRUCTOR_MODEL):
+                resp = await summary_llm.ainvoke(summary_prompt(self.summary, self.conversation_history[:n]))
+            self._fold(n, resp.content)
+        except Exception as e:
+            record_summary(failed=True)
+            print(f"Conversation summary failed: {e}")
+            return False
+        finally:
+            self._summarizing = False
+        return True
+
+    def _fold(self, n, summary):
+        # Turns only ever get appended meanwhile, so the first n are the ones summarized
+        self.summary = truncate_tokens(summary.strip(), CONTEXT_SUMMARY_TOKENS)
+        del self.conversation_history[:n]
+        record_summary(turns=n)
+
     @classmethod
     def from_llm(cls, llm: BaseLLM, verbose: bool = False, **kwargs) -> "TeachingGPT":
         teaching_conversation_utterance_chain = InstructorConversationChain.from_llm(
@@ -71,7 +149,19 @@ class TeachingGPT(BaseModel):
         )
 
 
-# Teaching agent instance
-config = dict(conversation_history=[], syllabus="", conversation_topic="")
-llm = ChatGroq(model="llama-3.1-8b-instant",groq_api_key=groq_api_key, temperature=0.9)
-teaching_agent = TeachingGPT.from_llm(llm, **config)
+# One LLM client and prompt chain shared by every learner's session
+llm = get_llm(INSTRUCTOR_MODEL, 0.9)
+instructor_chain = InstructorConversationChain.from_llm(llm, verbose=False)
+# Summaries should be faithful rather than creative
+summary_llm = get_llm(INSTRUCTOR_MODEL, 0.2)
+
+
+def new_teaching_agent(syllabus="", conversation_topic="", conversation_history=None, summary="") -> TeachingGPT:
+    """A per-learner agent; only its syllabus, summary and history are session state."""
+    return TeachingGPT(
+        teaching_conversation_utterance_chain=instructor_chain,
+        syllabus=syllabus,
+        conversation_topic=conversation_topic,
+        conversation_history=list(conversation_history or []),
+        summary=summary,
+    )
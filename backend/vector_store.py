@@ -2,11 +2,22 @@
 from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from PyPDF2 import PdfReader
+from pdf_extract import iter_pages, file_hash
+from embedding_cache import embedding_cache
+from segment_store import stage_segment, publish_segments, discard_segments
 import os
 import pickle
+import time
 
+# Pre-sharding global index; nothing reads it any more. migrate_legacy_index.py
+# moves it into a chosen user's shard once.
 VECTOR_DB_PATH = "backend/faiss_index.pkl"
+# Per-user (and optionally per-course) index shards live under this directory
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "backend/vector_shards")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Chunks held in memory before they are staged to disk as a segment; bounds
+# ingestion memory independently of document size
+INGEST_SEGMENT_CHUNKS = int(os.getenv("INGEST_SEGMENT_CHUNKS", "512"))
 
 # Load or create FAISS index
 def load_vectorstore():
@@ -22,33 +33,135 @@ def save_vectorstore(vectorstore):
     with open(VECTOR_DB_PATH, "wb") as f:
         pickle.dump(vectorstore, f)
 
+# Shard layout: <VECTOR_DB_DIR>/user_<id>[/course_<slug>]
+def shard_key(user_id, course=None):
+    key = f"user_{user_id}"
+    if course:
+        slug = "".join(c if c.isalnum() else "_" for c in course.strip().lower())
+        key = f"{key}/course_{slug}"
+    return key
+
+def shard_path(user_id, course=None):
+    return os.path.join(VECTOR_DB_DIR, shard_key(user_id, course))
+
 # Extract text from PDF
-def extract_text_from_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
+def iter_pdf_pages(file_path):
+    """Yield the text of each page, one page at a time."""
+    for page_text in iter_pages(file_path):
         if page_text:
-            text += page_text + "\n"
-    return text
+            yield page_text + "\n"
+
+def extract_text_from_pdf(file_path):
+    return "".join(iter_pdf_pages(file_path))
+
+# Split a stream of pages into chunks without joining the whole document.
+# The trailing (possibly partial) chunk of each page is carried over and
+# re-split together with the next page so chunks can still span page breaks.
+def iter_chunks(pages, text_splitter):
+    carry = ""
+    for page_text in pages:
+        chunks = text_splitter.split_text(carry + page_text)
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry:
+        yield carry
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Embedding model is loaded once per process and reused across ingestions
+_embeddings = None
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        # Use FastEmbed for free, local, and fast embeddings
+        _embeddings = FastEmbedEmbeddings()
+    return _embeddings
+
+# Stream pages -> chunks -> fixed-size embedding batches -> staged segments.
+# At most one page of text and INGEST_SEGMENT_CHUNKS chunks/vectors are held in
+# memory: every INGEST_SEGMENT_CHUNKS chunks are written to disk as an
+# unpublished segment, and the document's segments are published together in
+# one manifest update at the end. Publishing stays all-or-nothing (a failed or
+# resumed job never leaves part of a document searchable) and the write cost
+# is proportional to this document only.
+# Vectors come from the content-addressed embedding cache where possible, and
+# a byte-identical document that was already indexed is skipped outright.
+def ingest_pdf(file_path, index_path, batch_size=EMBED_BATCH_SIZE, on_progress=None):
+    stats = {
+        "pages": 0, "chunks": 0, "batches": 0, "seconds": 0.0, "pages_per_sec": 0.0,
+        "duplicate": False, "cache_hits": 0, "cache_misses": 0, "hit_rate": 0.0, "bytes_saved": 0,
+    }
+    start = time.perf_counter()
+
+    # Documents are deduplicated per index, so the same PDF can live in several shards
+    digest = file_hash(file_path)
+    doc_key = f"{index_path}:{digest}"
+    if embedding_cache.has_document(doc_key):
+        stats["duplicate"] = True
+        stats["bytes_saved"] = os.path.getsize(file_path)
+        stats["seconds"] = round(time.perf_counter() - start, 4)
+        print(f"Skipped {file_path}: identical document already indexed")
+        return stats
+
+    def counted_pages():
+        for page_text in iter_pdf_pages(file_path):
+            stats["pages"] += 1
+            yield page_text
 
-# Split text and create embeddings
-def add_pdf_to_vectorstore(file_path):
-    text = extract_text_from_pdf(file_path)
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs = text_splitter.split_text(text)
-    
-    # Use FastEmbed for free, local, and fast embeddings
-    embeddings = FastEmbedEmbeddings()
-    
-    # Load existing store or create a new one
-    if os.path.exists(VECTOR_DB_PATH):
-        vectorstore = FAISS.load_local(VECTOR_DB_PATH, embeddings, allow_dangerous_deserialization=True)
-        vectorstore.add_texts(docs)
-    else:
-        vectorstore = FAISS.from_texts(docs, embeddings)
-    
-    # Save the updated vector store
-    vectorstore.save_local(VECTOR_DB_PATH)
-    
-    return len(docs)
+    embeddings = get_embeddings()
+
+    staged = []
+    doc_store = None
+    try:
+        for batch in iter_batches(iter_chunks(counted_pages(), text_splitter), batch_size):
+            vectors = embedding_cache.embed_documents(embeddings, batch, stats)
+            if doc_store is None:
+                doc_store = FAISS.from_embeddings(list(zip(batch, vectors)), embeddings)
+            else:
+                doc_store.add_embeddings(list(zip(batch, vectors)))
+            stats["chunks"] += len(batch)
+            stats["batches"] += 1
+            if doc_store.index.ntotal >= INGEST_SEGMENT_CHUNKS:
+                staged.append(stage_segment(index_path, doc_store, sources=[digest]))
+                doc_store = None
+            if on_progress:
+                on_progress("embedding", stats)
+        if doc_store is not None:
+            staged.append(stage_segment(index_path, doc_store, sources=[digest]))
+            doc_store = None
+
+        # Publish the document's segments at once; existing segments are not rewritten
+        if staged:
+            if on_progress:
+                on_progress("saving", stats)
+            publish_segments(index_path, staged)
+    except BaseException:
+        discard_segments(index_path, [name for name, _ in staged])
+        raise
+    embedding_cache.add_document(doc_key, stats["chunks"])
+
+    stats["seconds"] = round(time.perf_counter() - start, 4)
+    if stats["seconds"] > 0:
+        stats["pages_per_sec"] = round(stats["pages"] / stats["seconds"], 2)
+    if stats["chunks"]:
+        stats["hit_rate"] = round(stats["cache_hits"] / stats["chunks"], 4)
+    print(f"Ingested {file_path}: {stats['pages']} pages, {stats['chunks']} chunks "
+          f"in {stats['seconds']}s ({stats['pages_per_sec']} pages/sec, "
+          f"cache hit rate {stats['hit_rate']:.0%}, {stats['bytes_saved']} bytes saved)")
+    return stats
+
+# Split text and create embeddings
+def add_pdf_to_vectorstore(file_path, index_path, batch_size=EMBED_BATCH_SIZE):
+    return ingest_pdf(file_path, index_path=index_path, batch_size=batch_size)["chunks"]
@@ -1,5 +1,5 @@
 import gradio as gr
-from frontend.utils.api_calls import rag_chat
+from frontend.utils.api_calls import stream_rag_chat
 
 def chat_ui(auth_token_state: gr.State):
     # The chatbot component displays the conversation history
@@ -22,13 +22,20 @@ def chat_ui(auth_token_state: gr.State):
         # We yield the history here to show the user's message in the UI immediately
         yield history, history
 
-        # Call the backend API
-        response_data = rag_chat(user_message, token)
-        ai_response = response_data.get("response", "Error: No response from server.")
-
-        # Append the AI's response to the history
-        history.append({"role": "assistant", "content": ai_response})
-
+        # Stream the reply into the history as tokens arrive
+        history.append({"role": "assistant", "content": ""})
+        for event, data in stream_rag_chat(user_message, token):
+            if event == "token":
+                history[-1]["content"] += data["token"]
+                yield history, history
+            elif event == "error":
+                history[-1]["content"] = f"Error: {data['error']}"
+                yield history, history
+            elif event == "done":
+                print(f"Chat reply: first token {data['ttft_s']}s, total {data['total_s']}s")
+
+        if not history[-1]["content"]:
+            history[-1]["content"] = "Error: No response from server."
         # Yield the final history
         yield history, history
 
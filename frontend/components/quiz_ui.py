@@ -4,8 +4,7 @@ from frontend.utils.api_calls import generate_quiz, submit_quiz_answers
 def quiz_ui(auth_token_state: gr.State):
     """Creates the UI for generating and taking a quiz."""
     with gr.Blocks() as interface:
-        topic_state = gr.State(value="")  # Store the quiz topic
-        quiz_state = gr.State(value=None)  # Store the generated quiz
+        quiz_state = gr.State(value=None)  # quiz_id and question count of the current quiz
 
         with gr.Row():
             topic_input = gr.Textbox(label="Topic", placeholder="e.g., Python Data Structures")
@@ -43,7 +42,8 @@ def quiz_ui(auth_token_state: gr.State):
                 return None, "", False, False, "", f"Error: {response['error']}"
 
             quiz_data = response.get("quiz")
-            if not quiz_data:
+            quiz_id = response.get("quiz_id")
+            if not quiz_data or quiz_id is None:
                  return None, "", False, False, "", f"Failed to parse quiz from response: {response}"
 
             # Format quiz for display
@@ -57,7 +57,9 @@ def quiz_ui(auth_token_state: gr.State):
             instructions = f"Enter your answers as indices (0-3) separated by commas. For example: 0,2,1,3,0 for {len(quiz_data)} questions."
             answers_placeholder = f"Enter {len(quiz_data)} answers separated by commas"
 
-            return quiz_data, quiz_md, True, True, "", f"Quiz generated! {instructions}"
+            # The answer key stays on the server; only the id is needed to submit
+            quiz = {"quiz_id": quiz_id, "n_questions": len(quiz_data)}
+            return quiz, quiz_md, True, True, "", f"Quiz generated! {instructions}"
 
         def handle_submit_quiz(quiz, answers_text, token):
             if not token:
@@ -73,10 +75,10 @@ def quiz_ui(auth_token_state: gr.State):
             except ValueError:
                 return "", "Invalid answer format. Please enter numbers separated by commas."
 
-            if len(answer_indices) != len(quiz):
-                return "", f"Please provide exactly {len(quiz)} answers."
+            if len(answer_indices) != quiz["n_questions"]:
+                return "", f"Please provide exactly {quiz['n_questions']} answers."
 
-            response = submit_quiz_answers(topic_state.value, quiz, answer_indices, token)
+            response = submit_quiz_answers(quiz["quiz_id"], answer_indices, token)
 
             if "error" in response:
                 return "", f"Error: {response['error']}"
@@ -110,13 +112,6 @@ def quiz_ui(auth_token_state: gr.State):
             outputs=[submit_btn]
         )
 
-        # Store topic when generating quiz
-        generate_btn.click(
-            lambda topic: topic,
-            inputs=[topic_input],
-            outputs=[topic_state]
-        )
-
         submit_btn.click(
             handle_submit_quiz,
             inputs=[quiz_state, answers_input, auth_token_state],
@@ -1,5 +1,11 @@
+import time
 import gradio as gr
-from frontend.utils.api_calls import upload_pdf, rag_chat
+from frontend.utils.api_calls import upload_pdf, get_ingest_status, stream_rag_chat
+
+INGEST_POLL_SECONDS = 2
+# Give up waiting after this long, or after this many status errors in a row
+INGEST_POLL_TIMEOUT_SECONDS = 30 * 60
+INGEST_POLL_MAX_ERRORS = 5
 
 
 def upload_ui(auth_token_state):
@@ -30,35 +36,93 @@ def upload_ui(auth_token_state):
     # --------------- Handlers ---------------
 
     def handle_upload(file_obj, token):
+        hidden = gr.update(visible=False)
         if not token:
-            return "❌ Please login first.", gr.update(visible=False), gr.update(visible=False)
+            yield "❌ Please login first.", hidden, hidden, None
+            return
 
         if file_obj is None:
-            return "⚠️ Please upload a PDF file first.", gr.update(visible=False), gr.update(visible=False)
+            yield "⚠️ Please upload a PDF file first.", hidden, hidden, None
+            return
 
         result = upload_pdf(file_obj, token)
-        if "error" in result:
-            return f"❌ Upload failed: {result['error']}", gr.update(visible=False), gr.update(visible=False)
+        if "error" in result or "detail" in result:
+            yield f"❌ Upload failed: {result.get('error', result.get('detail'))}", hidden, hidden, None
+            return
 
         filename = result.get("filename", file_obj.name)
-        success_msg = f"✅ PDF uploaded successfully: **{filename}**\nNow you can chat below ⬇️"
-        return success_msg, gr.update(visible=True), gr.update(visible=True), filename
+        job_id = result.get("job_id")
+
+        # Ingestion runs in the background; poll its status until it finishes
+        deadline = time.monotonic() + INGEST_POLL_TIMEOUT_SECONDS
+        errors = 0
+        while True:
+            if time.monotonic() > deadline:
+                yield (
+                    f"⌛ **{filename}** is still processing. Check back later; it will be searchable once done.",
+                    hidden, hidden, None,
+                )
+                return
+            status = get_ingest_status(job_id, token)
+            if "error" in status or "detail" in status:
+                errors += 1
+                if errors >= INGEST_POLL_MAX_ERRORS:
+                    yield f"❌ Could not get processing status: {status.get('error', status.get('detail'))}", hidden, hidden, None
+                    return
+                time.sleep(INGEST_POLL_SECONDS)
+                continue
+            errors = 0
+            if status["status"] == "done":
+                break
+            if status["status"] == "failed":
+                yield f"❌ Processing failed: {status.get('error')}", hidden, hidden, None
+                return
+            yield (
+                f"⏳ Processing **{filename}**: {status['stage']} — "
+                f"{status['pages_processed']} pages, {status['chunks_embedded']} chunks embedded",
+                hidden, hidden, None,
+            )
+            time.sleep(INGEST_POLL_SECONDS)
+
+        if status.get("duplicate"):
+            details = "already indexed, nothing to re-process"
+        else:
+            details = (
+                f"{status['pages_processed']} pages, {status['chunks_embedded']} chunks, "
+                f"{status.get('cache_hit_rate', 0):.0%} reused from cache"
+            )
+        success_msg = f"✅ PDF uploaded successfully: **{filename}** ({details})\nNow you can chat below ⬇️"
+        yield success_msg, gr.update(visible=True), gr.update(visible=True), filename
 
     def handle_chat(user_msg, history, token, filename):
         if not token:
-            new_history = history + [{"role": "user", "content": user_msg}, {"role": "assistant", "content": "⚠️ Please login first."}]
-            return new_history
+            yield history + [{"role": "user", "content": user_msg}, {"role": "assistant", "content": "⚠️ Please login first."}]
+            return
         if not filename:
-            new_history = history + [{"role": "user", "content": user_msg}, {"role": "assistant", "content": "⚠️ Please upload a PDF first."}]
-            return new_history
+            yield history + [{"role": "user", "content": user_msg}, {"role": "assistant", "content": "⚠️ Please upload a PDF first."}]
+            return
 
         # Add user message
         new_history = history + [{"role": "user", "content": user_msg}, {"role": "assistant", "content": "⌛ Thinking..."}]
-
-        response = rag_chat(user_msg, token)
-        answer = response.get("response", "⚠️ Error generating response.")
-        new_history[-1]["content"] = answer
-        return new_history
+        yield new_history
+
+        # Replace the placeholder with the answer as it streams in
+        answer = ""
+        for event, data in stream_rag_chat(user_msg, token):
+            if event == "token":
+                answer += data["token"]
+                new_history[-1]["content"] = answer
+                yield new_history
+            elif event == "error":
+                new_history[-1]["content"] = f"⚠️ Error generating response: {data['error']}"
+                yield new_history
+                return
+            elif event == "done":
+                print(f"RAG reply: first token {data['ttft_s']}s, total {data['total_s']}s")
+
+        if not answer:
+            new_history[-1]["content"] = "⚠️ Error generating response."
+            yield new_history
 
     # --------------- Events ---------------
     upload_btn.click(
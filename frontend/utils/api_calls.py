@@ -1,4 +1,5 @@
 import requests
+import json
 import os
 
 BASE_URL = "http://127.0.0.1:8000"
@@ -59,6 +60,22 @@ def upload_pdf(file_obj, token: str):
             except ValueError:
                 return {"error": "Failed to connect to the server or parse error response."}
 
+def get_ingest_status(job_id, token: str):
+    url = f"{BASE_URL}/ingest_status/{job_id}"
+    headers = auth_header(token)
+    if not headers:
+        return {"error": "Authentication required. Please login first."}
+    try:
+        resp = requests.get(url, headers=headers, timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Ingest status request failed: {e}")
+        try:
+            return e.response.json() if e.response else {"error": str(e)}
+        except ValueError:
+            return {"error": "Failed to connect to the server or parse error response."}
+
 
 def rag_chat(query, token: str):
     url = f"{BASE_URL}/rag_chat"
@@ -71,6 +88,45 @@ def rag_chat(query, token: str):
         print(f"RAG chat request failed: {e}")
         return {"error": str(e)}
 
+# ---------------- Streaming (server-sent events) ----------------
+def _stream_events(url, headers, **request_kwargs):
+    """
+    POST to a streaming endpoint and yield (event, data) pairs as they arrive:
+    ("token", {"token": ...}) per chunk, then ("done", timings) or ("error", {"error": ...}).
+    """
+    try:
+        with requests.post(url, headers=headers, stream=True, **request_kwargs) as resp:
+            resp.raise_for_status()
+            event = "message"
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line:
+                    event = "message"
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+    except requests.exceptions.RequestException as e:
+        print(f"Streaming request to {url} failed: {e}")
+        try:
+            detail = e.response.json().get("detail") if e.response is not None else None
+        except ValueError:
+            detail = None
+        yield "error", {"error": detail or str(e)}
+
+def stream_rag_chat(query, token: str):
+    headers = auth_header(token)
+    if not headers:
+        yield "error", {"error": "Authentication required. Please login first."}
+        return
+    yield from _stream_events(f"{BASE_URL}/rag_chat_stream", headers, json={"message": query})
+
+def stream_chat(message: str, token: str):
+    headers = auth_header(token)
+    if not headers:
+        yield "error", {"error": "Authentication required. Please login first."}
+        return
+    yield from _stream_events(f"{BASE_URL}/chat_stream", headers, params={"message": message})
+
 # ---------------- Generate Syllabus ----------------
 def generate_syllabus(topic: str, token: str):
     url = f"{BASE_URL}/generate_syllabus"
@@ -143,12 +199,12 @@ def get_progress(token: str):
             return {"error": "Failed to connect to the server or parse error response."}
 
 # ---------------- Submit Quiz Answers ----------------
-def submit_quiz_answers(topic: str, quiz: list, answers: list, token: str):
+def submit_quiz_answers(quiz_id: int, answers: list, token: str):
     url = f"{BASE_URL}/submit_quiz_answers"
     headers = auth_header(token)
     if not headers:
         return {"error": "Authentication required. Please login first."}
-    data = {"topic": topic, "quiz": quiz, "answers": answers}
+    data = {"quiz_id": quiz_id, "answers": answers}
     try:
         resp = requests.post(url, json=data, headers=headers)
         resp.raise_for_status()